@@ -0,0 +1,141 @@
+import logging
+import os
+import queue
+import threading
+
+from contextlib import contextmanager
+from selenium import webdriver
+from webdriver_manager.chrome import ChromeDriverManager
+from selenium.webdriver.chrome.service import Service
+from print_module import Print
+
+
+class BrowserPool:
+    """Fixed-size pool of headless Chrome drivers shared by crawl workers.
+
+    Drivers are started on first use, up to size of them. A worker checks
+    one out per page with session(). A driver that served max_pages pages
+    or raised during a session is quit and replaced by a fresh one, which
+    keeps Chrome's memory growth in check.
+    """
+
+    # Resident memory budget of one headless Chrome, used to bound the pool size
+    DRIVER_MEMORY = 768 * 1024 * 1024
+    MAX_SIZE = 8
+    MAX_PAGES = 200
+    PAGE_LOAD_TIMEOUT = 30
+
+    _driver_path = None
+    _path_lock = threading.Lock()
+
+    def __init__(self, size=None, max_pages=None):
+        # Never more drivers than the host can hold, whatever was asked for
+        self.size = min(size, self.default_size()) if size else self.default_size()
+        self.max_pages = max_pages or self.MAX_PAGES
+        self.idle = queue.LifoQueue()
+        self.pages = {}
+        self.started = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+    @classmethod
+    def default_size(cls):
+        """As many drivers as the CPUs and the physical memory allow."""
+        size = min(os.cpu_count() or 1, cls.MAX_SIZE)
+        try:
+            memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+            size = min(size, memory // 2 // cls.DRIVER_MEMORY)
+        except (AttributeError, ValueError, OSError):
+            pass
+        return max(1, size)
+
+    @classmethod
+    def driver_path(cls):
+        """Install chromedriver once, not once per driver."""
+        with cls._path_lock:
+            if cls._driver_path is None:
+                cls._driver_path = ChromeDriverManager().install()
+            return cls._driver_path
+
+    @classmethod
+    def create_driver(cls):
+        """Setup Chrome driver"""
+        options = webdriver.ChromeOptions()
+        options.add_experimental_option("excludeSwitches", ["enable-logging"])
+        options.add_argument("--log-level=3")  # Suppress logs
+        options.add_argument("--disable-logging")  # Disable logging
+        options.add_argument("--silent")  # Silent mode
+        options.add_argument("headless")
+        options.add_argument("window-size=1920x1080")
+        options.add_argument("disable-gpu")
+        service = Service(executable_path=cls.driver_path())
+        driver = webdriver.Chrome(options=options, service=service)
+        driver.set_page_load_timeout(cls.PAGE_LOAD_TIMEOUT)
+        return driver
+
+    def _start(self):
+        driver = self.create_driver()
+        self.pages[id(driver)] = 0
+        return driver
+
+    def acquire(self):
+        """An idle driver, a new one while the pool is not full, else wait for one."""
+        while True:
+            try:
+                return self.idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self.lock:
+                start = self.started < self.size
+                if start:
+                    self.started += 1
+            if start:
+                try:
+                    return self._start()
+                except Exception:
+                    with self.lock:
+                        self.started -= 1
+                    raise
+            """A retired driver frees a slot without going through the queue, poll for it"""
+            try:
+                return self.idle.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    def release(self, driver, broken=False):
+        self.pages[id(driver)] += 1
+        if broken or self.closed or self.pages[id(driver)] >= self.max_pages:
+            self._retire(driver)
+            return
+        self.idle.put(driver)
+
+    def _retire(self, driver):
+        del self.pages[id(driver)]
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.error(f"BROWSER - Error quitting driver: {e}")
+        with self.lock:
+            self.started -= 1
+
+    @contextmanager
+    def session(self):
+        """Check a driver out for one page of work."""
+        driver = self.acquire()
+        try:
+            yield driver
+        except Exception:
+            self.release(driver, broken=True)
+            raise
+        self.release(driver)
+
+    def close(self):
+        """Quit every idle driver, drivers still checked out are quit on release."""
+        self.closed = True
+        while True:
+            try:
+                driver = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._retire(driver)
+        Print.success("Browser pool closed")
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http_client import HttpClient
+from print_module import Print
+
+
+class CrawlEngine:
+    """Run blocking fetch jobs concurrently under a per-host concurrency cap."""
+
+    DEFAULT_CONCURRENCY = 4
+
+    # Maximum number of in-flight requests per host
+    HOST_CONCURRENCY = {
+        "bvsc.com.vn": 4,
+        "vietcap.com.vn": 4,
+        "vdsc.com.vn": 6,
+        "vcbs.com.vn": 4,
+        "dsc.com.vn": 4,
+        "extgw.dsc.com.vn": 4,
+        "vndirect.com.vn": 2,
+    }
+
+    # Number of listing pages kept in flight while the consumer works
+    PAGE_WINDOW = 8
+    # Smaller window for incremental runs, which usually stop after a page or two
+    INCREMENTAL_WINDOW = 2
+
+    @staticmethod
+    def host_key(url):
+        host = HttpClient.host_of(url)
+        return host[4:] if host.startswith("www.") else host
+
+    @classmethod
+    def concurrency_for(cls, host):
+        return cls.HOST_CONCURRENCY.get(host, cls.DEFAULT_CONCURRENCY)
+
+    @classmethod
+    def map(cls, func, items, url_of=None):
+        """Call func(item) for every item concurrently, results in input order.
+
+        url_of(item) tells which host the job talks to (defaults to the item
+        itself being a url). Failed jobs are logged and return None.
+        """
+        items = list(items)
+        if not items:
+            return []
+        url_of = url_of or (lambda item: item)
+        return asyncio.run(cls._map(func, items, url_of))
+
+    @classmethod
+    async def _map(cls, func, items, url_of):
+        semaphores = {}
+
+        async def run(item):
+            host = cls.host_key(url_of(item))
+            if host not in semaphores:
+                semaphores[host] = asyncio.Semaphore(cls.concurrency_for(host))
+            async with semaphores[host]:
+                try:
+                    return await asyncio.to_thread(func, item)
+                except Exception as e:
+                    Print.error(f"Error fetching {url_of(item)}: {e}")
+                    logging.error(f"ENGINE - Error fetching {url_of(item)}: {e}")
+                    return None
+
+        return await asyncio.gather(*(run(item) for item in items))
+
+    @classmethod
+    def fetch_json(cls, urls):
+        """Fetch and decode every url concurrently, None for failures."""
+        return cls.map(HttpClient.get_json, urls)
+
+    @classmethod
+    def iter_map(cls, func, items, window=None, url_of=None):
+        """Yield (item, func(item)) in input order, keeping `window` jobs in flight.
+
+        Each result is yielded as soon as it and the ones before it are done,
+        so consumers start before the window is complete. Failed jobs are
+        logged and yield None. Closing the generator cancels pending jobs.
+        """
+        items = list(items)
+        if not items:
+            return
+        url_of = url_of or (lambda item: item)
+        window = min(
+            window or cls.PAGE_WINDOW, cls.concurrency_for(cls.host_key(url_of(items[0])))
+        )
+        executor = ThreadPoolExecutor(max_workers=window, thread_name_prefix="crawl-engine")
+        pending = deque()
+        try:
+            for item in items:
+                pending.append((item, executor.submit(func, item)))
+                if len(pending) >= window:
+                    yield cls._result(*pending.popleft(), url_of)
+            while pending:
+                yield cls._result(*pending.popleft(), url_of)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _result(item, future, url_of):
+        try:
+            return item, future.result()
+        except Exception as e:
+            Print.error(f"Error fetching {url_of(item)}: {e}")
+            logging.error(f"ENGINE - Error fetching {url_of(item)}: {e}")
+            return item, None
+
+    @classmethod
+    def iter_json(cls, urls, window=None):
+        """Yield (url, json) in order, with up to `window` urls in flight."""
+        return cls.iter_map(HttpClient.get_json, urls, window)
@@ -0,0 +1,93 @@
+import pandas as pd
+
+
+class CrawlState:
+    """High-water mark of one (source, reportType, language) listing.
+
+    Every listing API is sorted newest first, so once a page holds only
+    items at or below the stored mark the rest of the listing is known.
+    The mark is only saved by commit(), after the whole category has been
+    walked, so an interrupted run never hides older unseen items.
+    """
+
+    def __init__(self, conn, source, report_type, language, incremental=False, category=""):
+        self.conn = conn
+        self.key = (source, report_type, language, str(category))
+        self.incremental = incremental
+        self.ensure_table(conn)
+        self.mark = self.load(conn, *self.key) if incremental else None
+        self.newest = None
+        self.complete = True
+
+    @staticmethod
+    def ensure_table(conn):
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS crawl_state (
+                source TEXT NOT NULL,
+                reportType TEXT NOT NULL,
+                language TEXT NOT NULL,
+                category TEXT NOT NULL DEFAULT '',
+                lastDate TEXT NOT NULL,
+                lastId TEXT,
+                updatedAt TEXT NOT NULL,
+                PRIMARY KEY (source, reportType, language, category)
+            )
+            """
+        )
+
+    @staticmethod
+    def load(conn, source, report_type, language, category=""):
+        """Return (lastDate, lastId) or None when the listing was never crawled."""
+        row = conn.execute(
+            """
+            SELECT lastDate, lastId FROM crawl_state
+            WHERE source = ? AND reportType = ? AND language = ? AND category = ?
+            """,
+            (source, report_type, language, category),
+        ).fetchone()
+        return tuple(row) if row else None
+
+    @staticmethod
+    def normalize_date(date):
+        return pd.Timestamp(date).strftime("%Y-%m-%d %H:%M:%S")
+
+    def is_known(self, date, item_id=None):
+        """True when an item is not newer than the stored mark."""
+        if self.mark is None:
+            return False
+        last_date, last_id = self.mark
+        date = self.normalize_date(date)
+        if date != last_date:
+            return date < last_date
+        return last_id is None or item_id is None or str(item_id) == last_id
+
+    def page_is_known(self, items):
+        """True when a non-empty page of (date, id) pairs is entirely known."""
+        return bool(items) and all(self.is_known(date, item_id) for date, item_id in items)
+
+    def seen(self, date, item_id=None):
+        """Record an item so commit() can move the mark forward."""
+        date = self.normalize_date(date)
+        if self.newest is None or date > self.newest[0]:
+            self.newest = (date, None if item_id is None else str(item_id))
+
+    def incomplete(self):
+        """Flag a skipped page, the mark is then left untouched by commit()."""
+        self.complete = False
+
+    def commit(self):
+        """Store the newest item seen as the mark, never moving it backwards."""
+        if self.newest is None or not self.complete:
+            return
+        current = self.load(self.conn, *self.key)
+        if current is not None and current[0] > self.newest[0]:
+            return
+        self.conn.execute(
+            """
+            INSERT OR REPLACE INTO crawl_state (source, reportType, language, category, lastDate, lastId, updatedAt)
+            VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+            """,
+            (*self.key, *self.newest),
+        )
+        self.conn.commit()
@@ -0,0 +1,113 @@
+import base64
+import logging
+import os
+import pathlib
+import re
+import shutil
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from image_cache import ImageCache
+from print_module import Print
+
+
+class HtmlImages:
+    """Image handling for article HTML rendered to PDF."""
+
+    VALID_SRC = re.compile(r"^(http|https|/|\./|data:image)")
+
+    IMAGE_WORKERS = 8
+    # (connect, read) timeout of one image request
+    IMAGE_TIMEOUT = (5, 15)
+    # Longest wait for all the images of one article
+    ARTICLE_TIMEOUT = 30
+
+    _executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def sanitize(cls, content, base_url):
+        """Drop images without a usable src and make the others absolute."""
+        for img_tag in content.find_all("img"):
+            src = img_tag.get("src")
+            if not src or cls.VALID_SRC.match(src) is None:
+                img_tag.decompose()
+                continue
+
+            if src.startswith("./"):
+                img_tag["src"] = f"{base_url}{src[1:]}"
+            elif src.startswith("/"):
+                img_tag["src"] = f"{base_url}{src}"
+        return content
+
+    @staticmethod
+    def download_and_convert_image(url, timeout=None):
+        """Fetches an image through the ImageCache and returns its PNG Base64 encoding."""
+        return base64.b64encode(ImageCache.get_png(url, timeout)).decode("utf-8")
+
+    @classmethod
+    def image_src(cls, url, directory=None, timeout=None):
+        """New src of a remote image, a file uri in directory or else a base64 data uri."""
+        if directory is None:
+            return f"data:image/png;base64,{cls.download_and_convert_image(url, timeout)}"
+
+        path = ImageCache.get_path(url, timeout)
+        target = os.path.join(directory, os.path.basename(path))
+        if not os.path.exists(target):
+            """A hard link costs no copy and survives cache eviction"""
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copyfile(path, target)
+        return pathlib.Path(os.path.abspath(target)).as_uri()
+
+    @classmethod
+    def _pool(cls):
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=cls.IMAGE_WORKERS, thread_name_prefix="html-images"
+                )
+            return cls._executor
+
+    @classmethod
+    def inline(cls, content, directory=None):
+        """Replace remote images with local PNGs the renderer can always read.
+
+        With a directory the images are written there and referenced by
+        file uri, otherwise they are embedded as base64 data uris. Images
+        are fetched and converted concurrently, the HTML is rewritten once
+        all of them are done. An image that fails, or is still pending after
+        ARTICLE_TIMEOUT, is dropped so the renderer never fetches it itself.
+        """
+        img_tags = [
+            img_tag
+            for img_tag in content.find_all("img")
+            if img_tag.get("src", "").startswith(("http://", "https://"))
+        ]
+        if not img_tags:
+            return content
+
+        pool = cls._pool()
+        futures = {
+            src: pool.submit(cls.image_src, src, directory, cls.IMAGE_TIMEOUT)
+            for src in {img_tag["src"] for img_tag in img_tags}
+        }
+        wait(futures.values(), timeout=cls.ARTICLE_TIMEOUT)
+
+        for img_tag in img_tags:
+            src = img_tag["src"]
+            future = futures[src]
+            if not future.done():
+                future.cancel()
+                Print.warning(f"Image {src} timed out, dropping it")
+                logging.error(f"IMAGES - Image {src} timed out")
+                img_tag.decompose()
+                continue
+            try:
+                img_tag["src"] = future.result()
+            except Exception as e:
+                Print.error(f"Error converting image {src} to PNG: {e}")
+                logging.error(f"IMAGES - Error converting image {src} to base64: {e}")
+                img_tag.decompose()
+        return content
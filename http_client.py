@@ -0,0 +1,171 @@
+import socket
+import threading
+import time
+import requests
+
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from rate_limiter import RateLimiter
+
+
+class HttpClient:
+    """Shared keep-alive HTTP sessions, one connection pool per host."""
+
+    DEFAULT_HEADERS = {
+        "Accept": "application/json, text/html;q=0.9, */*;q=0.8",
+        "Accept-Encoding": "gzip, deflate",
+        "Accept-Language": "vi-VN,vi;q=0.9,en-US;q=0.8,en;q=0.7",
+        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36 Edg/128.0.0.0",
+    }
+
+    BROWSER_HEADERS = {
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+        "Accept-Encoding": "gzip, deflate, br, zstd",
+        "Cache-Control": "max-age=0",
+        "sec-ch-ua": '"Chromium";v="128", "Not;A=Brand";v="24", "Microsoft Edge";v="128"',
+        "sec-ch-ua-mobile": "?0",
+        "sec-ch-ua-platform": '"Windows"',
+        "sec-fetch-dest": "document",
+        "sec-fetch-mode": "navigate",
+        "sec-fetch-site": "same-origin",
+        "sec-fetch-user": "?1",
+        "upgrade-insecure-requests": "1",
+        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36 Edg/128.0.0.0",
+    }
+
+    # Hosts that only answer properly to browser-like requests
+    HOST_HEADERS = {
+        "www.dsc.com.vn": BROWSER_HEADERS,
+        "www.vndirect.com.vn": BROWSER_HEADERS,
+    }
+
+    # (connect, read) timeout in seconds
+    DEFAULT_TIMEOUT = (10, 60)
+
+    POOL_MAXSIZE = 16
+    CONNECT_RETRIES = 3
+
+    # Statuses retried after the rate limiter has backed the host off
+    RETRY_STATUSES = (429, 502, 503, 504)
+    STATUS_RETRIES = 2
+
+    DNS_TTL = 600
+
+    _sessions = {}
+    _lock = threading.Lock()
+
+    # One jar for every host session, so a login cookie reaches redirect targets too
+    _cookies = requests.cookies.RequestsCookieJar()
+
+    _dns_cache = {}
+    _dns_lock = threading.Lock()
+    _getaddrinfo = None
+
+    @classmethod
+    def install_dns_cache(cls):
+        """Cache socket.getaddrinfo results for DNS_TTL seconds."""
+        if cls._getaddrinfo is not None:
+            return
+        cls._getaddrinfo = socket.getaddrinfo
+
+        def cached_getaddrinfo(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            with cls._dns_lock:
+                cached = cls._dns_cache.get(key)
+                if cached and cached[0] > now:
+                    return cached[1]
+            result = cls._getaddrinfo(*args, **kwargs)
+            with cls._dns_lock:
+                cls._dns_cache[key] = (now + cls.DNS_TTL, result)
+            return result
+
+        socket.getaddrinfo = cached_getaddrinfo
+
+    @staticmethod
+    def host_of(url):
+        return urlsplit(url).netloc.lower()
+
+    @classmethod
+    def session(cls, url):
+        """Return the pooled session for the host of url."""
+        host = cls.host_of(url)
+        with cls._lock:
+            session = cls._sessions.get(host)
+            if session is None:
+                session = cls._new_session(host)
+                cls._sessions[host] = session
+            return session
+
+    @classmethod
+    def _new_session(cls, host):
+        session = requests.Session()
+        session.headers.update(cls.HOST_HEADERS.get(host, cls.DEFAULT_HEADERS))
+        session.cookies = cls._cookies
+
+        """Retry only on connection errors, HTTP statuses are left to the caller"""
+        retry = Retry(
+            total=cls.CONNECT_RETRIES,
+            connect=cls.CONNECT_RETRIES,
+            read=0,
+            status=0,
+            backoff_factor=0.5,
+            allowed_methods=None,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=cls.POOL_MAXSIZE, max_retries=retry
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @classmethod
+    def load_cookies(cls, cookies):
+        """Add cookies exported by a browser (Selenium get_cookies() dicts)."""
+        for cookie in cookies:
+            cls._cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain", ""),
+                path=cookie.get("path", "/"),
+                secure=cookie.get("secure", False),
+            )
+
+    @classmethod
+    def request(cls, method, url, **kwargs):
+        """Rate-limited request, retried while the host answers 429/5xx."""
+        kwargs.setdefault("timeout", cls.DEFAULT_TIMEOUT)
+        session = cls.session(url)
+        for attempt in range(cls.STATUS_RETRIES + 1):
+            RateLimiter.acquire(url)
+            response = session.request(method, url, **kwargs)
+            RateLimiter.feedback(
+                url, response.status_code, RateLimiter.retry_after_of(response)
+            )
+            if response.status_code not in cls.RETRY_STATUSES or attempt == cls.STATUS_RETRIES:
+                return response
+            response.close()
+
+    @classmethod
+    def get(cls, url, **kwargs):
+        return cls.request("GET", url, **kwargs)
+
+    @classmethod
+    def head(cls, url, **kwargs):
+        return cls.request("HEAD", url, **kwargs)
+
+    @classmethod
+    def get_json(cls, url, **kwargs):
+        return cls.get(url, **kwargs).json()
+
+    @classmethod
+    def close(cls):
+        """Close every pooled session."""
+        with cls._lock:
+            for session in cls._sessions.values():
+                session.close()
+            cls._sessions.clear()
+
+
+HttpClient.install_dns_cache()
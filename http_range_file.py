@@ -0,0 +1,118 @@
+import io
+import re
+
+from http_client import HttpClient
+
+
+class HttpRangeFile(io.RawIOBase):
+    """Read-only seekable file over HTTP, fetching only the blocks that are read.
+
+    pdfminer reads a PDF from its trailer and xref table and then only the
+    objects it needs, so extracting the first page through this file
+    transfers a small part of the document. Contiguous missing blocks are
+    fetched with a single Range request and kept for later reads.
+    """
+
+    BLOCK_SIZE = 64 * 1024
+
+    # Ranges must be counted on the raw bytes, not on a compressed body
+    RANGE_HEADERS = {"Accept-Encoding": "identity"}
+
+    CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+    def __init__(self, url, size, block_size=None):
+        super().__init__()
+        self.url = url
+        self.size = size
+        self.block_size = block_size or self.BLOCK_SIZE
+        self.position = 0
+        self.blocks = {}
+        self.bytes_fetched = 0
+
+    @classmethod
+    def open(cls, url, block_size=None):
+        """Open url for reading, None when the server has no file for it.
+
+        Servers that ignore Range get the whole body read into a BytesIO.
+        """
+        block_size = block_size or cls.BLOCK_SIZE
+        response = HttpClient.get(
+            url, headers={**cls.RANGE_HEADERS, "Range": f"bytes=0-{block_size - 1}"}
+        )
+        if response.status_code == 206:
+            match = cls.CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+            if match and int(match.group(1)) == 0:
+                file = cls(url, int(match.group(3)), block_size)
+                file._store(0, response.content)
+                return file
+            """Unusable range answer, fall back to the whole file"""
+            response = HttpClient.get(url)
+        if response.status_code != 200:
+            return None
+        return io.BytesIO(response.content)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self.position = max(position, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.size)
+        if self.position >= end:
+            return 0
+        first, last = self.position // self.block_size, (end - 1) // self.block_size
+        self._fetch(first, last)
+
+        data = b"".join(self.blocks[index] for index in range(first, last + 1))
+        start = self.position - first * self.block_size
+        chunk = data[start : start + end - self.position]
+        buffer[: len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+    def _fetch(self, first, last):
+        """Fetch the missing blocks of [first, last], one request per contiguous run."""
+        missing = [index for index in range(first, last + 1) if index not in self.blocks]
+        runs = []
+        for index in missing:
+            if runs and runs[-1][1] == index - 1:
+                runs[-1][1] = index
+            else:
+                runs.append([index, index])
+
+        for run_first, run_last in runs:
+            begin = run_first * self.block_size
+            end = min((run_last + 1) * self.block_size, self.size) - 1
+            response = HttpClient.get(
+                self.url, headers={**self.RANGE_HEADERS, "Range": f"bytes={begin}-{end}"}
+            )
+            if response.status_code == 200:
+                """The server sent the whole file after all, keep all of it"""
+                self._store(0, response.content)
+                return
+            if response.status_code != 206:
+                raise IOError(
+                    f"Range request for {self.url} failed with status {response.status_code}"
+                )
+            self._store(begin, response.content)
+
+    def _store(self, offset, data):
+        self.bytes_fetched += len(data)
+        for start in range(0, len(data), self.block_size):
+            self.blocks[(offset + start) // self.block_size] = data[start : start + self.block_size]
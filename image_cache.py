@@ -0,0 +1,181 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+from http_client import HttpClient
+from print_module import Print
+
+
+class ImageCache:
+    """On-disk cache of remote images converted to PNG, keyed by url.
+
+    Entries are served from disk for FRESH_SECONDS, then revalidated with
+    their ETag. A failed revalidation serves the stale copy. Urls that
+    were never fetched are remembered for NEGATIVE_TTL seconds when they
+    fail, so a broken logo is not requested again for every article. The
+    least recently used files are evicted once the cache outgrows MAX_BYTES.
+    """
+
+    ROOT = "./bcpt_pdf/image_cache"
+    DB_PATH = "./bcpt_pdf/image_cache/index.db"
+
+    MAX_BYTES = 512 * 1024 * 1024
+    # Evict down to this share of MAX_BYTES, so eviction does not run on every store
+    EVICT_TO = 0.9
+    FRESH_SECONDS = 24 * 3600
+    NEGATIVE_TTL = 6 * 3600
+
+    _local = threading.local()
+
+    @classmethod
+    def _connection(cls):
+        conn = getattr(cls._local, "conn", None)
+        if conn is None:
+            os.makedirs(cls.ROOT, exist_ok=True)
+            conn = sqlite3.connect(cls.DB_PATH, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS images (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    fetchedAt REAL,
+                    lastUsed REAL,
+                    failedAt REAL,
+                    error TEXT
+                )
+                """
+            )
+            conn.commit()
+            cls._local.conn = conn
+        return conn
+
+    @classmethod
+    def path_of(cls, url):
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(cls.ROOT, name[:2], f"{name}.png")
+
+    @staticmethod
+    def to_png(image_bytes):
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            with io.BytesIO() as output:
+                img.save(output, format="PNG")
+                return output.getvalue()
+
+    @classmethod
+    def get_png(cls, url, timeout=None):
+        """PNG bytes of the image at url, from disk whenever possible."""
+        with open(cls.get_path(url, timeout), "rb") as f:
+            return f.read()
+
+    @classmethod
+    def get_path(cls, url, timeout=None):
+        """Path of the cached PNG of the image at url, fetched when missing or stale."""
+        conn = cls._connection()
+        row = conn.execute(
+            "SELECT etag, fetchedAt, failedAt, error FROM images WHERE url = ?", (url,)
+        ).fetchone()
+        now = time.time()
+        path = cls.path_of(url)
+
+        headers = {}
+        cached = False
+        if row:
+            etag, fetched_at, failed_at, error = row
+            cached = bool(fetched_at) and os.path.exists(path)
+            if cached:
+                if now - fetched_at < cls.FRESH_SECONDS:
+                    return cls._touch(url, path, now)
+                if etag:
+                    headers["If-None-Match"] = etag
+            elif failed_at and now - failed_at < cls.NEGATIVE_TTL:
+                raise IOError(f"Image {url} failed recently: {error}")
+
+        try:
+            response = HttpClient.get(
+                url, headers=headers, timeout=timeout or HttpClient.DEFAULT_TIMEOUT
+            )
+            if response.status_code == 304:
+                conn.execute("UPDATE images SET fetchedAt = ? WHERE url = ?", (now, url))
+                conn.commit()
+                return cls._touch(url, path, now)
+            response.raise_for_status()
+            png = cls.to_png(response.content)
+        except Exception as e:
+            if cached:
+                """A stale image beats no image, try again on the next request"""
+                Print.warning(f"Serving stale image {url}: {e}")
+                return cls._touch(url, path, now)
+            cls._failed(url, e, now)
+            raise
+
+        cls._store(url, path, png, response.headers.get("ETag"), now)
+        return path
+
+    @classmethod
+    def _touch(cls, url, path, now):
+        conn = cls._connection()
+        conn.execute("UPDATE images SET lastUsed = ? WHERE url = ?", (now, url))
+        conn.commit()
+        return path
+
+    @classmethod
+    def _store(cls, url, path, png, etag, now):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(png)
+        os.replace(temp_path, path)
+
+        conn = cls._connection()
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO images (url, etag, size, fetchedAt, lastUsed, failedAt, error)
+            VALUES (?, ?, ?, ?, ?, NULL, NULL)
+            """,
+            (url, etag, len(png), now, now),
+        )
+        conn.commit()
+        cls.evict()
+
+    @classmethod
+    def _failed(cls, url, error, now):
+        conn = cls._connection()
+        conn.execute(
+            """
+            INSERT INTO images (url, failedAt, error) VALUES (?, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET failedAt = excluded.failedAt, error = excluded.error
+            """,
+            (url, now, str(error)),
+        )
+        conn.commit()
+
+    @classmethod
+    def evict(cls):
+        """Delete least recently used images until the cache fits in MAX_BYTES."""
+        conn = cls._connection()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0]
+        if total <= cls.MAX_BYTES:
+            return
+
+        target = cls.MAX_BYTES * cls.EVICT_TO
+        evicted = 0
+        for url, size in conn.execute(
+            "SELECT url, size FROM images WHERE size > 0 ORDER BY lastUsed"
+        ).fetchall():
+            if total <= target:
+                break
+            try:
+                os.remove(cls.path_of(url))
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM images WHERE url = ?", (url,))
+            total -= size
+            evicted += 1
+        conn.commit()
+        Print.warning(f"Evicted {evicted} images from the image cache")
@@ -0,0 +1,35 @@
+import hashlib
+
+from print_module import Print
+
+
+class KnownReports:
+    """In-memory set of reports already stored, checked before any network call.
+
+    Keys are the (source, language, reportKey) triples of the reports table,
+    kept as 64-bit fingerprints so a few hundred thousand reports only take
+    a few megabytes.
+    """
+
+    def __init__(self, conn):
+        self.fingerprints = set()
+        for source, language, report_key in conn.execute(
+            "SELECT source, language, reportKey FROM reports WHERE reportKey IS NOT NULL"
+        ):
+            self.fingerprints.add(self.fingerprint(source, language, report_key))
+        Print.success(f"Loaded {len(self.fingerprints)} known reports")
+
+    @staticmethod
+    def fingerprint(source, language, report_key):
+        digest = hashlib.blake2b(
+            f"{source}\x1f{language}\x1f{report_key}".encode("utf-8"), digest_size=8
+        ).digest()
+        return int.from_bytes(digest, "big")
+
+    def contains(self, source, language, *report_keys):
+        """True when any of the candidate keys of a report is already stored."""
+        return any(
+            self.fingerprint(source, language, report_key) in self.fingerprints
+            for report_key in report_keys
+            if report_key
+        )
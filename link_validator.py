@@ -0,0 +1,44 @@
+import threading
+
+from crawl_engine import CrawlEngine
+from http_client import HttpClient
+
+
+class LinkValidator:
+    """Check that public article links are alive without downloading them.
+
+    A HEAD request is enough for most servers, those that refuse HEAD get
+    a one-byte ranged GET instead. Results are cached per url for the life
+    of the process, failures to connect are not cached.
+    """
+
+    # HEAD answers that say nothing about the page itself
+    HEAD_UNSUPPORTED = (403, 405, 501)
+    VALID_STATUSES = (200, 206)
+
+    _cache = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def is_valid(cls, url):
+        """True when url answers with the page, raises when it cannot be reached."""
+        with cls._lock:
+            if url in cls._cache:
+                return cls._cache[url]
+
+        response = HttpClient.head(url, allow_redirects=True)
+        status = response.status_code
+        if status in cls.HEAD_UNSUPPORTED:
+            with HttpClient.get(url, headers={"Range": "bytes=0-0"}, stream=True) as response:
+                status = response.status_code
+
+        valid = status in cls.VALID_STATUSES
+        with cls._lock:
+            cls._cache[url] = valid
+        return valid
+
+    @classmethod
+    def check_all(cls, urls):
+        """Check urls concurrently, {url: valid} with None for unreachable ones."""
+        urls = list(dict.fromkeys(url for url in urls if url))
+        return dict(zip(urls, CrawlEngine.map(cls.is_valid, urls)))
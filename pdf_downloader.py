@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from http_client import HttpClient
+from pdf_store import PdfStore
+from print_module import Print
+
+
+class PdfDownloader:
+    """Worker pool streaming PDFs into the PdfStore while the crawlers keep paging.
+
+    Each file is streamed in chunks to a .part file in the store's temp
+    directory, hashed on the way and moved to its content address once
+    complete. A .part left by an interrupted download is resumed with an
+    HTTP Range request.
+    """
+
+    WORKERS = 6
+    CHUNK_SIZE = 256 * 1024
+    RETRIES = 3
+
+    def __init__(self, workers=None):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or self.WORKERS, thread_name_prefix="pdf-download"
+        )
+        self.futures = []
+
+    def submit(self, url, report, on_failure=None):
+        """Queue a download for report, a (source, language, reportKey) tuple.
+
+        on_failure() runs in the worker if the file cannot be fetched.
+        """
+        if PdfStore.has_file(report):
+            print(f"PDF already stored: {url}")
+            return None
+        future = self.executor.submit(self._run, url, report, on_failure)
+        self.futures.append(future)
+        return future
+
+    def _run(self, url, report, on_failure):
+        try:
+            stored = self.download(url, report)
+            if stored:
+                sha256, size = stored
+                PdfStore.link(report, sha256, size)
+                Print.success(f"Download PDF: {url} successfully")
+                return True
+            Print.warning(f"PDF Expired: {url}")
+            logging.error(f"DOWNLOAD - PDF Expired: {url}")
+        except Exception as e:
+            Print.error(f"Error downloading {url}: {e}")
+            logging.error(f"DOWNLOAD - Error downloading {url}: {e}")
+        if on_failure:
+            try:
+                on_failure()
+            except Exception as e:
+                Print.error(f"Error saving alternate PDF for {url}: {e}")
+                logging.error(f"DOWNLOAD - Error saving alternate PDF for {url}: {e}")
+        return False
+
+    @staticmethod
+    def part_path(url, report):
+        """Stable temporary path, so a retry of the same download resumes it."""
+        name = hashlib.sha1("\x1f".join([url, *report]).encode("utf-8")).hexdigest()
+        return PdfStore.temp_path(name)
+
+    @classmethod
+    def download(cls, url, report):
+        """Stream url into the store, (sha256, size) or None when the server has no file."""
+        part_path = cls.part_path(url, report)
+        for attempt in range(cls.RETRIES):
+            try:
+                stored = cls._fetch(url, part_path)
+                if stored:
+                    PdfStore.adopt(part_path, stored[0])
+                return stored
+            except Exception as e:
+                if attempt == cls.RETRIES - 1:
+                    raise
+                Print.warning(f"Download of {url} interrupted ({e}), resuming...")
+
+    @classmethod
+    def _fetch(cls, url, part_path):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        with HttpClient.get(url, headers=headers, stream=True) as response:
+            if response.status_code == 416:
+                """The partial file does not match the remote one, start over"""
+                os.remove(part_path)
+                return cls._fetch(url, part_path)
+            if response.status_code not in (200, 206):
+                return None
+
+            """A 200 answer to a Range request means the server restarted from byte 0"""
+            if response.status_code == 206:
+                hasher, mode = PdfStore.hash_file(part_path), "ab"
+            else:
+                hasher, mode = hashlib.sha256(), "wb"
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(cls.CHUNK_SIZE):
+                    f.write(chunk)
+                    hasher.update(chunk)
+        return hasher.hexdigest(), os.path.getsize(part_path)
+
+    def join(self):
+        """Wait for every queued download and stop the workers."""
+        wait(self.futures)
+        self.futures = []
+        self.executor.shutdown()
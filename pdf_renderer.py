@@ -0,0 +1,124 @@
+import logging
+import multiprocessing
+import os
+import threading
+
+from concurrent.futures import ProcessPoolExecutor, wait
+from pdf_store import PdfStore
+from print_module import Print
+
+
+STYLESHEET = """
+@page {
+    margin: 10mm 40mm;
+}
+html * {
+    font-family: Arial, Helvetica, sans-serif;
+}
+img {
+    max-width: 100%;
+    height: auto;
+}
+"""
+
+PAGE_TEMPLATE = """<html>
+    <head>
+        <title></title>
+        <meta charset="UTF-8">
+    </head>
+    <body>{body}</body>
+</html>"""
+
+_stylesheet = None
+_font_config = None
+
+
+def _init_worker():
+    """Import WeasyPrint and compile the stylesheet once per worker process."""
+    global _stylesheet, _font_config
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+    _font_config = FontConfiguration()
+    _stylesheet = CSS(string=STYLESHEET, font_config=_font_config)
+
+
+def render_report(report, html_str, base_url=None):
+    """Render html_str and store it as the file of report, in a worker process."""
+    from weasyprint import HTML
+
+    pdf = HTML(string=html_str, base_url=base_url).write_pdf(
+        stylesheets=[_stylesheet], font_config=_font_config
+    )
+    PdfStore.save(report, pdf, kind="html")
+    return len(pdf)
+
+
+class PdfRenderer:
+    """Shared pool of long-lived WeasyPrint renderers for HTML-only reports.
+
+    Every worker process loads WeasyPrint and the stylesheet once, so a
+    report costs a render instead of a wkhtmltopdf process launch. The
+    output goes to the PdfStore under the report's own identity.
+    """
+
+    WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+
+    _executor = None
+    _futures = []
+    _lock = threading.Lock()
+
+    @classmethod
+    def _pool(cls):
+        with cls._lock:
+            if cls._executor is None:
+                """Spawned, a forked renderer would keep the SQLite connection of the thread
+                that happened to start the pool, usually a download worker's"""
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=cls.WORKERS,
+                    initializer=_init_worker,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return cls._executor
+
+    @staticmethod
+    def page(content_str):
+        """Wrap an article body in the page template used for every render."""
+        return PAGE_TEMPLATE.format(
+            body=content_str.replace("font-size: 14pt;", "font-size: 12pt;")
+        )
+
+    @classmethod
+    def render(cls, report, content, base_url=None):
+        """Queue a render of content, an HTML element or string, for report."""
+        future = cls._pool().submit(render_report, report, cls.page(str(content)), base_url)
+        future.add_done_callback(lambda future: cls._done(report, future))
+        with cls._lock:
+            cls._futures.append(future)
+        return future
+
+    @classmethod
+    def render_now(cls, report, content, base_url=None):
+        """Render content for report in this process and wait for it."""
+        if _stylesheet is None:
+            _init_worker()
+        return render_report(report, cls.page(str(content)), base_url)
+
+    @staticmethod
+    def _done(report, future):
+        try:
+            future.result()
+            Print.success(f"Alternate PDF saved for {report[2]}")
+        except Exception as e:
+            Print.error(f"Error rendering PDF for {report[2]}: {e}")
+            logging.error(f"RENDER - Error rendering PDF for {report[2]}: {e}")
+
+    @classmethod
+    def join(cls):
+        """Wait for every queued render and stop the workers."""
+        with cls._lock:
+            futures, cls._futures = cls._futures, []
+            executor, cls._executor = cls._executor, None
+        wait(futures)
+        if executor is not None:
+            executor.shutdown()
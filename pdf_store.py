@@ -0,0 +1,135 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import uuid
+
+
+class PdfStore:
+    """Content-addressed PDF storage shared by every service.
+
+    Blobs live at ROOT/<aa>/<bb>/<sha256>.pdf and are written once, however
+    many reports point at them. The report_files table links a report,
+    identified by (source, language, reportKey), to its blob.
+    """
+
+    ROOT = "./bcpt_pdf/blobs"
+    TMP_DIR = "./bcpt_pdf/blobs/tmp"
+    DB_PATH = "reports.db"
+
+    _local = threading.local()
+
+    @classmethod
+    def _connection(cls):
+        """Per-thread connection so download workers can link files themselves."""
+        conn = getattr(cls._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(cls.DB_PATH, timeout=30)
+            conn.execute("PRAGMA busy_timeout=30000")
+            cls.ensure_table(conn)
+            cls._local.conn = conn
+        return conn
+
+    @staticmethod
+    def ensure_table(conn):
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS report_files (
+                source TEXT NOT NULL,
+                language TEXT NOT NULL,
+                reportKey TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                createdAt TEXT NOT NULL,
+                PRIMARY KEY (source, language, reportKey)
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS report_files_sha256 ON report_files (sha256)"
+        )
+        conn.commit()
+
+    @classmethod
+    def blob_path(cls, sha256):
+        return os.path.join(cls.ROOT, sha256[:2], sha256[2:4], f"{sha256}.pdf")
+
+    @classmethod
+    def exists(cls, sha256):
+        return os.path.exists(cls.blob_path(sha256))
+
+    @classmethod
+    def temp_path(cls, name=None):
+        os.makedirs(cls.TMP_DIR, exist_ok=True)
+        return os.path.join(cls.TMP_DIR, f"{name or uuid.uuid4().hex}.part")
+
+    @staticmethod
+    def hash_file(path):
+        """SHA-256 hasher already fed with the content of path."""
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        return hasher
+
+    @classmethod
+    def adopt(cls, temp_path, sha256):
+        """Move a complete temp file into the store, dropping it if the blob exists."""
+        blob_path = cls.blob_path(sha256)
+        if os.path.exists(blob_path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(temp_path, blob_path)
+        return blob_path
+
+    @classmethod
+    def put_bytes(cls, data):
+        """Store an in-memory PDF, returns its sha256."""
+        sha256 = hashlib.sha256(data).hexdigest()
+        if not cls.exists(sha256):
+            temp_path = cls.temp_path()
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            cls.adopt(temp_path, sha256)
+        return sha256
+
+    @classmethod
+    def file_of(cls, report):
+        """Blob path of a (source, language, reportKey) report, None if it has none."""
+        row = cls._connection().execute(
+            "SELECT sha256 FROM report_files WHERE source = ? AND language = ? AND reportKey = ?",
+            report,
+        ).fetchone()
+        if row is None or not cls.exists(row[0]):
+            return None
+        return cls.blob_path(row[0])
+
+    @classmethod
+    def has_file(cls, report):
+        """True when the (source, language, reportKey) report already has a blob."""
+        return cls.file_of(report) is not None
+
+    @classmethod
+    def link(cls, report, sha256, size, kind="pdf"):
+        """Point a report at a blob, kind is "pdf" for downloads, "html" for renders."""
+        conn = cls._connection()
+        conn.execute(
+            """
+            INSERT INTO report_files (source, language, reportKey, sha256, size, kind, createdAt)
+            VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+            ON CONFLICT (source, language, reportKey) DO UPDATE SET
+                sha256 = excluded.sha256, size = excluded.size, kind = excluded.kind
+            WHERE report_files.sha256 IS NOT excluded.sha256
+            """,
+            (*report, sha256, size, kind),
+        )
+        conn.commit()
+
+    @classmethod
+    def save(cls, report, data, kind="pdf"):
+        """Store PDF bytes and link them to a report in one go."""
+        sha256 = cls.put_bytes(data)
+        cls.link(report, sha256, len(data), kind)
+        return cls.blob_path(sha256)
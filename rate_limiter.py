@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+
+class RateLimiter:
+    """Per-site token buckets shared by threads, tasks and processes.
+
+    Bucket state lives in a small SQLite file so that several crawler
+    processes running at once draw from the same budget. Every change
+    happens inside a BEGIN IMMEDIATE transaction.
+    """
+
+    DB_PATH = "rate_limit.db"
+
+    # site: (requests per second, burst)
+    SITE_LIMITS = {
+        "bvsc.com.vn": (2.0, 4),
+        "vdsc.com.vn": (5.0, 10),
+        "vietcap.com.vn": (2.0, 4),
+        "vcbs.com.vn": (2.0, 4),
+        "dsc.com.vn": (2.0, 4),
+        "vndirect.com.vn": (1.0, 2),
+    }
+    DEFAULT_LIMIT = (2.0, 4)
+
+    # Adaptive slow-down on 429/5xx, slow recovery on success
+    SLOWDOWN = 0.5
+    RECOVERY = 1.1
+    MIN_FACTOR = 0.05
+    BACKOFF_SECONDS = 5.0
+    MAX_BACKOFF_SECONDS = 120.0
+
+    _local = threading.local()
+
+    @classmethod
+    def site_of(cls, url):
+        """Map a url (or bare host) to the configured site it belongs to."""
+        host = urlsplit(url).hostname or url
+        host = host.lower()
+        for site in cls.SITE_LIMITS:
+            if host == site or host.endswith("." + site):
+                return site
+        return host[4:] if host.startswith("www.") else host
+
+    @classmethod
+    def limit_for(cls, site):
+        return cls.SITE_LIMITS.get(site, cls.DEFAULT_LIMIT)
+
+    @classmethod
+    def _connection(cls):
+        conn = getattr(cls._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(cls.DB_PATH, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS buckets (
+                    site TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    factor REAL NOT NULL DEFAULT 1.0,
+                    blocked_until REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            cls._local.conn = conn
+        return conn
+
+    @classmethod
+    def _reserve(cls, site):
+        """Take a token if possible, otherwise return how long to wait."""
+        rate, burst = cls.limit_for(site)
+        conn = cls._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, updated, factor, blocked_until FROM buckets WHERE site = ?",
+                (site,),
+            ).fetchone()
+            tokens, updated, factor, blocked_until = row or (burst, now, 1.0, 0.0)
+
+            effective_rate = rate * factor
+            tokens = min(burst, tokens + max(0.0, now - updated) * effective_rate)
+            if now < blocked_until:
+                wait = blocked_until - now
+            elif tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / effective_rate
+
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (site, tokens, updated, factor, blocked_until) VALUES (?, ?, ?, ?, ?)",
+                (site, tokens, now, factor, blocked_until),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    @classmethod
+    def acquire(cls, url):
+        """Block until the site of url has a free token."""
+        site = cls.site_of(url)
+        while True:
+            wait = cls._reserve(site)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    @classmethod
+    def feedback(cls, url, status_code, retry_after=None):
+        """Slow a site down on 429/5xx and let it recover on success."""
+        site = cls.site_of(url)
+        conn = cls._connection()
+        if status_code == 429 or status_code >= 500:
+            factor_row = conn.execute(
+                "SELECT factor FROM buckets WHERE site = ?", (site,)
+            ).fetchone()
+            factor = factor_row[0] if factor_row else 1.0
+            backoff = min(
+                cls.MAX_BACKOFF_SECONDS,
+                retry_after if retry_after is not None else cls.BACKOFF_SECONDS / factor,
+            )
+            conn.execute(
+                "UPDATE buckets SET factor = MAX(?, factor * ?), blocked_until = MAX(blocked_until, ?) WHERE site = ?",
+                (cls.MIN_FACTOR, cls.SLOWDOWN, time.time() + backoff, site),
+            )
+        elif status_code < 400:
+            conn.execute(
+                "UPDATE buckets SET factor = MIN(1.0, factor * ?) WHERE site = ? AND factor < 1.0",
+                (cls.RECOVERY, site),
+            )
+
+    @staticmethod
+    def retry_after_of(response):
+        """Seconds from a Retry-After header, None if absent or not numeric."""
+        value = response.headers.get("Retry-After")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
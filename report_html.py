@@ -0,0 +1,159 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import zlib
+
+from bs4 import BeautifulSoup
+from html_images import HtmlImages
+from pdf_renderer import PdfRenderer
+from pdf_store import PdfStore
+from print_module import Print
+
+
+class ReportHtml:
+    """Sanitized article HTML of reports without a downloadable PDF.
+
+    The crawlers only store the compressed HTML, the PDF is rendered the
+    first time it is asked for and kept in the PdfStore afterwards.
+
+    Usage: python report_html.py <source> <language> <reportKey>
+           python report_html.py --all [source]
+    """
+
+    DB_PATH = "reports.db"
+    COMPRESSION_LEVEL = 9
+
+    # Hand images to the renderer as files in a per-job directory instead of base64
+    FILE_IMAGES = True
+
+    _local = threading.local()
+
+    @classmethod
+    def _connection(cls):
+        """Per-thread connection, items are stored from the crawl engine threads."""
+        conn = getattr(cls._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(cls.DB_PATH, timeout=30)
+            conn.execute("PRAGMA busy_timeout=30000")
+            cls.ensure_table(conn)
+            cls._local.conn = conn
+        return conn
+
+    @staticmethod
+    def ensure_table(conn):
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS report_html (
+                source TEXT NOT NULL,
+                language TEXT NOT NULL,
+                reportKey TEXT NOT NULL,
+                html BLOB NOT NULL,
+                createdAt TEXT NOT NULL,
+                PRIMARY KEY (source, language, reportKey)
+            )
+            """
+        )
+        conn.commit()
+
+    @classmethod
+    def save(cls, report, content):
+        """Store the HTML of report = (source, language, reportKey)."""
+        html = zlib.compress(str(content).encode("utf-8"), cls.COMPRESSION_LEVEL)
+        conn = cls._connection()
+        conn.execute(
+            """
+            INSERT INTO report_html (source, language, reportKey, html, createdAt)
+            VALUES (?, ?, ?, ?, datetime('now'))
+            ON CONFLICT (source, language, reportKey) DO UPDATE SET html = excluded.html
+            WHERE report_html.html IS NOT excluded.html
+            """,
+            (*report, html),
+        )
+        conn.commit()
+
+    @classmethod
+    def load(cls, report):
+        row = cls._connection().execute(
+            "SELECT html FROM report_html WHERE source = ? AND language = ? AND reportKey = ?",
+            report,
+        ).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    @classmethod
+    def materialize(cls, report):
+        """Path of the report's PDF, rendered from its HTML on first request."""
+        file_path = PdfStore.file_of(report)
+        if file_path:
+            return file_path
+        html = cls.load(report)
+        if html is None:
+            return None
+
+        image_dir = cls.image_dir()
+        try:
+            content = HtmlImages.inline(BeautifulSoup(html, "html.parser"), image_dir)
+            PdfRenderer.render_now(report, content)
+        finally:
+            cls.cleanup(image_dir)
+        return PdfStore.file_of(report)
+
+    @classmethod
+    def image_dir(cls):
+        """Fresh directory for the images of one render, None for base64 images."""
+        if not cls.FILE_IMAGES:
+            return None
+        os.makedirs(PdfStore.TMP_DIR, exist_ok=True)
+        return tempfile.mkdtemp(prefix="images-", dir=PdfStore.TMP_DIR)
+
+    @staticmethod
+    def cleanup(image_dir):
+        if image_dir:
+            shutil.rmtree(image_dir, ignore_errors=True)
+
+    @classmethod
+    def pending(cls, source=None):
+        """Reports with stored HTML but no PDF yet."""
+        query = """
+            SELECT h.source, h.language, h.reportKey FROM report_html h
+            LEFT JOIN report_files f
+            ON f.source = h.source AND f.language = h.language AND f.reportKey = h.reportKey
+            WHERE f.sha256 IS NULL
+        """
+        params = ()
+        if source:
+            query += " AND h.source = ?"
+            params = (source,)
+        PdfStore.ensure_table(cls._connection())
+        return [tuple(row) for row in cls._connection().execute(query, params)]
+
+    @classmethod
+    def materialize_all(cls, source=None):
+        """Render every pending report in the renderer pool."""
+        reports = cls.pending(source)
+        Print.success(f"Rendering {len(reports)} reports...")
+        for report in reports:
+            image_dir = cls.image_dir()
+            content = HtmlImages.inline(
+                BeautifulSoup(cls.load(report), "html.parser"), image_dir
+            )
+            future = PdfRenderer.render(report, content)
+            future.add_done_callback(lambda future, image_dir=image_dir: cls.cleanup(image_dir))
+        PdfRenderer.join()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "--all":
+        ReportHtml.materialize_all(sys.argv[2] if len(sys.argv) > 2 else None)
+    elif len(sys.argv) == 4:
+        file_path = ReportHtml.materialize(tuple(sys.argv[1:4]))
+        if file_path:
+            print(file_path)
+        else:
+            Print.error("No stored HTML for this report")
+            sys.exit(1)
+    else:
+        print(ReportHtml.__doc__)
+        sys.exit(2)
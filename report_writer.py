@@ -0,0 +1,233 @@
+import logging
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+from print_module import Print
+
+
+class ReportWriter:
+    """Buffer report records and upsert them in one transaction per batch.
+
+    A report is identified by (source, language, reportKey). The key is its
+    linkWeb, else its date and headline. migrate() derives the same key for
+    rows stored before the column existed.
+    """
+
+    COLUMNS = [
+        "source",
+        "ticker",
+        "date",
+        "reportType",
+        "recommendation",
+        "headline",
+        "content",
+        "analyst",
+        "language",
+        "linkWeb",
+        "linkDrive",
+    ]
+
+    KEY_COLUMNS = ["source", "language", "reportKey"]
+
+    # Keyed by date and headline even with a linkWeb, their link takes a request to resolve
+    HEADLINE_KEYED_SOURCES = ["vcbs"]
+
+    # headline_key() in SQL, a missing headline is spelled the way Python formats None
+    HEADLINE_KEY_SQL = "date || '|' || COALESCE(headline, 'None')"
+
+    # Filled in after the insert by the TextExtractor, a re-crawl must not clear them
+    KEEP_COLUMNS = ["recommendation"]
+
+    BATCH_SIZE = 500
+    LOCK_RETRIES = 6
+    LOCK_BACKOFF = 0.5
+
+    def __init__(self, conn, batch_size=None):
+        self.conn = conn
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.pending = []
+        self.lock = threading.Lock()
+        self.prepare(conn)
+
+    @classmethod
+    def prepare(cls, conn):
+        """Switch the database to WAL and bring the reports table up to date."""
+        conn.commit()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        cls.ensure_table(conn)
+        cls.migrate(conn)
+
+    @staticmethod
+    def ensure_table(conn):
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS reports (
+                source TEXT,
+                ticker TEXT,
+                date TEXT,
+                reportType TEXT,
+                recommendation TEXT,
+                headline TEXT,
+                content TEXT,
+                analyst TEXT,
+                language TEXT,
+                linkWeb TEXT,
+                linkDrive TEXT,
+                reportKey TEXT
+            )
+            """
+        )
+        conn.commit()
+
+    @classmethod
+    def migrate(cls, conn):
+        """Add reportKey to older databases, drop duplicate rows and index the key."""
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(reports)")]
+        if "reportKey" not in columns:
+            Print.warning("Migrating reports table: adding reportKey")
+            conn.execute("ALTER TABLE reports ADD COLUMN reportKey TEXT")
+        conn.execute(
+            f"""
+            UPDATE reports SET reportKey = COALESCE(NULLIF(linkWeb, ''), {cls.HEADLINE_KEY_SQL})
+            WHERE reportKey IS NULL
+            """
+        )
+        sources = ", ".join("?" for _ in cls.HEADLINE_KEYED_SOURCES)
+        conn.execute(
+            f"""
+            UPDATE OR REPLACE reports SET reportKey = {cls.HEADLINE_KEY_SQL}
+            WHERE source IN ({sources}) AND reportKey IS NOT {cls.HEADLINE_KEY_SQL}
+            """,
+            cls.HEADLINE_KEYED_SOURCES,
+        )
+
+        """Keep the most recent copy of every report, rows without a key are never duplicates"""
+        removed = conn.execute(
+            """
+            DELETE FROM reports WHERE reportKey IS NOT NULL AND rowid NOT IN (
+                SELECT MAX(rowid) FROM reports WHERE reportKey IS NOT NULL
+                GROUP BY source, language, reportKey
+            )
+            """
+        ).rowcount
+        if removed:
+            Print.warning(f"Removed {removed} duplicate reports")
+
+        conn.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS reports_natural_key
+            ON reports (source, language, reportKey)
+            """
+        )
+        conn.commit()
+
+    @staticmethod
+    def headline_key(date, headline):
+        date_str = pd.Timestamp(date).strftime("%Y-%m-%d %H:%M:%S")
+        return f"{date_str}|{headline}"
+
+    @classmethod
+    def report_key(cls, data):
+        if data["linkWeb"] and data["source"] not in cls.HEADLINE_KEYED_SOURCES:
+            return data["linkWeb"]
+        return cls.headline_key(data["date"], data["headline"])
+
+    @classmethod
+    def identity(cls, data):
+        """(source, language, reportKey) of a record, as used by PdfStore."""
+        return (data["source"], data["language"], cls.report_key(data))
+
+    @classmethod
+    def to_row(cls, data):
+        row = dict(data)
+        row["date"] = pd.Timestamp(data["date"]).strftime("%Y-%m-%d %H:%M:%S")
+        row["reportKey"] = cls.report_key(data)
+        return tuple(row[column] for column in cls.COLUMNS + ["reportKey"])
+
+    @classmethod
+    def insert_query(cls):
+        """Upsert that only rewrites a stored row when one of its values changed."""
+        columns = cls.COLUMNS + ["reportKey"]
+        updated = {
+            column: (
+                f"COALESCE(excluded.{column}, reports.{column})"
+                if column in cls.KEEP_COLUMNS
+                else f"excluded.{column}"
+            )
+            for column in columns
+            if column not in cls.KEY_COLUMNS
+        }
+        return f"""
+            INSERT INTO reports ({", ".join(columns)})
+            VALUES ({", ".join("?" for _ in columns)})
+            ON CONFLICT ({", ".join(cls.KEY_COLUMNS)}) DO UPDATE SET
+                {", ".join(f"{column} = {value}" for column, value in updated.items())}
+            WHERE {" OR ".join(f"reports.{column} IS NOT {value}" for column, value in updated.items())}
+        """
+
+    def add(self, data):
+        """Queue one record, writing the batch once it is full."""
+        with self.lock:
+            self.pending.append(data)
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write every queued record in a single transaction."""
+        with self.lock:
+            records, self.pending = self.pending, []
+            if not records:
+                return
+            try:
+                self._execute_many(records)
+                Print.success(f"{len(records)} records upserted successfully")
+            except Exception as e:
+                if self.is_locked(e):
+                    Print.error(f"Error inserting batch of {len(records)} records: {e}")
+                    logging.error(f"WRITER - Error inserting batch of {len(records)} records: {e}")
+                    return
+                """Fall back to one row at a time so a bad record does not sink the batch"""
+                Print.warning(f"Batch insert failed ({e}), inserting records one by one")
+                self._insert_one_by_one(records)
+
+    @staticmethod
+    def is_locked(error):
+        message = str(error)
+        return isinstance(error, sqlite3.OperationalError) and (
+            "locked" in message or "busy" in message
+        )
+
+    def _execute_many(self, records):
+        rows = [self.to_row(data) for data in records]
+        for attempt in range(self.LOCK_RETRIES):
+            try:
+                self.conn.executemany(self.insert_query(), rows)
+                self.conn.commit()
+                return
+            except Exception as e:
+                self.conn.rollback()
+                if not self.is_locked(e) or attempt == self.LOCK_RETRIES - 1:
+                    raise
+                time.sleep(self.LOCK_BACKOFF * 2**attempt)
+
+    def _insert_one_by_one(self, records):
+        for data in records:
+            try:
+                self._execute_many([data])
+            except Exception as e:
+                Print.error(f"Error inserting {data['headline']}: {e}")
+                logging.error(f"WRITER - Error inserting {data['headline']}: {e}")
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,12 +1,14 @@
-import os
-import time
-import random
-import requests
+import sys
 import math
-import re
 import pandas as pd
 import sqlite3
 from bs4 import BeautifulSoup as bs
+from http_client import HttpClient
+from crawl_engine import CrawlEngine
+from crawl_state import CrawlState
+from report_writer import ReportWriter
+from known_reports import KnownReports
+from pdf_downloader import PdfDownloader
 
 
 class BcptBscService:
@@ -31,89 +33,99 @@ class BcptBscService:
     BASE_URL = "https://bvsc.com.vn"
 
     @staticmethod
-    def download_pdf(url, file_name):
-        """Download PDF file"""
-        file_name = re.sub(r'[<>:"/\\|?*\']', "", file_name).replace(" ", "_")
-        if not file_name.endswith(".pdf"):
-            file_name += ".pdf"
+    def download_pdf(downloader, url, data):
+        """Queue PDF file download into the PdfStore"""
+        downloader.submit(url, ReportWriter.identity(data))
 
-        file_path = os.path.join("./bcpt_pdf/bvsc/", file_name)
-
-        with open(file_path, "wb") as file:
-            response = requests.get(url, timeout=10)
-            file.write(response.content)
-
-    @staticmethod
-    def insert_data(cursor, data, conn, retries=3):
-        """Insert data into the SQLite database with retries."""
-        date_str = pd.Timestamp(data["date"]).strftime("%Y-%m-%d %H:%M:%S")
-        insert_query = f"""
-            INSERT INTO reports (source, ticker, date, reportType, recommendation, headline, content, analyst, language, linkWeb, linkDrive)
-            VALUES ('{data["source"]}', '{data["ticker"]}', '{date_str}', '{data["reportType"]}', '{data["recommendation"]}', '{data["headline"]}', '{data["content"]}', '{data["analyst"]}', '{data["language"]}', '{data["linkWeb"]}', '{data["linkDrive"]}')
-        """
-        while retries > 0:
-            try:
-                cursor.execute(insert_query)
-                conn.commit()
-                print("Data inserted successfully!")
-                break
-            except Exception as e:
-                print(f"Error inserting {data['headline']}: {e}")
-                retries -= 1
-                time.sleep(2)
+    @classmethod
+    def transform_data(cls, data_raw, report_type):
+        """Transform raw data to the desired format."""
+        return {
+            "source": "bvs",
+            "ticker": (
+                data_raw["maCK"]
+                if report_type == "Company Research"
+                else None
+            ),
+            "date": pd.Timestamp(data_raw["ngayHienThi"]).tz_localize(None),
+            "reportType": report_type,
+            "recommendation": (
+                data_raw["name"].lower()
+                if report_type == "Company Research"
+                else None
+            ),
+            "headline": data_raw["name"],
+            "content": bs(
+                data_raw["description"], "html.parser"
+            ).get_text(),
+            "analyst": None,
+            "language": "VI",
+            "linkWeb": cls.BASE_URL + data_raw["url"],
+            "linkDrive": None,
+        }
 
     @classmethod
-    def crawl_bcpt_bsc(cls, cursor, conn):
+    def crawl_bcpt_bsc(cls, cursor, conn, incremental=False):
         """Main method to crawl reports and insert data into the database."""
+        writer = ReportWriter(conn)
+        known = KnownReports(conn)
+        downloader = PdfDownloader()
         for idx, link in enumerate(cls.LINKS_VI):
-            time.sleep(1.5)
-            res_json = requests.get(link).json()
+            res_json = HttpClient.get(link).json()
             total_records = res_json["totalRecords"]
             page_num = math.ceil(total_records / 12)
             report_type = cls.REPORT_TYPES[idx]
-
-            for page in range(page_num):
+            state = CrawlState(conn, "bvs", report_type, "VI", incremental)
+
+            """Fetch listing pages concurrently"""
+            page_links = [
+                link.replace("trang=1", f"trang={page + 1}") for page in range(page_num)
+            ]
+            window = CrawlEngine.INCREMENTAL_WINDOW if incremental else None
+            for page, (_, page_json) in enumerate(CrawlEngine.iter_json(page_links, window)):
                 print(f"Crawling page {page + 1} of {page_num}...")
-                reports_link = link.replace("trang=1", f"trang={page + 1}")
-                time.sleep(1.5)
-
-                data_raw_list = requests.get(reports_link).json()["items"]
-                for data_raw in data_raw_list:
-                    time.sleep(random.uniform(1.5, 2))
-                    print(f'Crawling {data_raw["name"]}...')
-
-                    # Create metadata
-                    data = {
-                        "source": "bvs",
-                        "ticker": (
-                            data_raw["maCK"]
-                            if report_type == "Company Research"
-                            else None
-                        ),
-                        "date": pd.Timestamp(data_raw["ngayHienThi"]).tz_localize(None),
-                        "reportType": report_type,
-                        "recommendation": (
-                            data_raw["name"].lower()
-                            if report_type == "Company Research"
-                            else None
-                        ),
-                        "headline": data_raw["name"],
-                        "content": bs(
-                            data_raw["description"], "html.parser"
-                        ).get_text(),
-                        "analyst": None,
-                        "language": "VI",
-                        "linkWeb": cls.BASE_URL + data_raw["url"],
-                        "linkDrive": None,
-                    }
-
-                    # Download PDF file
+                if page_json is None:
+                    state.incomplete()
+                    continue
+
+                data_raw_list = page_json["items"]
+                data_list = [
+                    cls.transform_data(data_raw, report_type)
+                    for data_raw in data_raw_list
+                ]
+                keys = [
+                    (data["date"], data_raw["id"])
+                    for data_raw, data in zip(data_raw_list, data_list)
+                ]
+                for date, report_id in keys:
+                    state.seen(date, report_id)
+                if state.page_is_known(keys):
+                    print("Reached already crawled reports, stop paging.")
+                    break
+
+                # Skip reports stored by a previous run
+                new_items = [
+                    (data_raw, data)
+                    for data_raw, data, key in zip(data_raw_list, data_list, keys)
+                    if not state.is_known(*key)
+                    and not known.contains("bvs", "VI", data["linkWeb"])
+                ]
+
+                # Queue PDF downloads, the pool fetches them while paging goes on
+                for data_raw, data in new_items:
                     download_link = f"{cls.BASE_URL}/download_attachment/{data_raw['fileInfo']['id']}?_={data_raw['id']}"
-                    file_name = f"{data['headline']}"
-                    cls.download_pdf(download_link, file_name)
+                    cls.download_pdf(downloader, download_link, data)
+
+                # Insert data into the reports table
+                for _, data in new_items:
+                    print(f'Crawling {data["headline"]}...')
+                    writer.add(data)
+                writer.flush()
+
+            state.commit()
 
-                    # Insert data into the reports table
-                    cls.insert_data(cursor, data, conn)
+        downloader.join()
+        writer.close()
 
 
 # Connect to the SQLite
@@ -121,6 +133,6 @@ conn = sqlite3.connect("reports.db")
 cursor = conn.cursor()
 
 bcpt_service = BcptBscService()
-bcpt_service.crawl_bcpt_bsc(cursor, conn)
+bcpt_service.crawl_bcpt_bsc(cursor, conn, incremental="--incremental" in sys.argv)
 
 conn.close()
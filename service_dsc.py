@@ -1,17 +1,22 @@
-import requests
 import pandas as pd
 import sqlite3
+import sys
 import validators
-import pdfkit
 import logging
+import os
+import re
+import threading
 
 from print_module import Print
+from http_client import HttpClient
+from crawl_engine import CrawlEngine
+from crawl_state import CrawlState
+from report_writer import ReportWriter
+from known_reports import KnownReports
+from report_html import ReportHtml
+from pdf_downloader import PdfDownloader
 from bs4 import BeautifulSoup
 
-config = pdfkit.configuration(
-    wkhtmltopdf=r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
-)
-
 logging.basicConfig(
     filename="error_log.txt",
     level=logging.ERROR,
@@ -45,169 +50,148 @@ class BcptDscService:
 
     LANGUAGE_LIST = ["VI", "EN"]
 
-    header = {
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-        "Accept-Encoding": "gzip, deflate, br, zstd",
-        "Cache-Control": "max-age=0",
-        "sec-ch-ua": '"Chromium";v="128", "Not;A=Brand";v="24", "Microsoft Edge";v="128"',
-        "sec-ch-ua-mobile": "?0",
-        "sec-ch-ua-platform": '"Windows"',
-        "sec-fetch-dest": "document",
-        "sec-fetch-mode": "navigate",
-        "sec-fetch-site": "same-origin",
-        "sec-fetch-user": "?1",
-        "upgrade-insecure-requests": "1",
-        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36 Edg/128.0.0.0",
-    }
+    # Next.js build ID, the prefix of every /_next/data url
+    BUILD_ID_CACHE = "dsc_build_id.txt"
+    BUILD_MANIFEST = re.compile(r"/_next/static/([^/\"']+)/_buildManifest\.js")
+    _build_id = None
+    _build_id_lock = threading.Lock()
 
     @staticmethod
-    def save_alternate_pdf(content):
+    def save_alternate_html(content, report):
 
         if not content:
             Print.error("No content to convert to PDF")
             return
-        """Convert PDF file"""
+        """Store the article without images, its PDF is rendered on demand"""
         for img_tag in content.find_all("img"):
             img_tag.decompose()
 
-        content_str = str(content)
-        html_str = (
-            """<html>
-                    <head>
-                    <title>Title of the document</title>
-                    <style>
-                        html * {
-                        font-family: Arial, Helvetica, sans-serif;
-                        }
-                    </style>
-                    </head>
-                    <body>"""
-            + content_str.replace("font-size: 14pt;", "font-size: 12pt;")
-            + """</body>
-                </html>"""
-        )
-
-        r = pdfkit.PDFKit(
-            html_str,
-            options={
-                "encoding": "UTF-8",
-                "enable-local-file-access": None,
-                "margin-left": "40mm",
-                "margin-right": "40mm",
-                "quiet": "",
-            },
-            configuration=config,
-            type_="string",
-        )
-
-        pdf = r.to_pdf()
-        with open("./bcpt_pdf/vcsc/metadata.pdf", "wb") as f:
-            f.write(pdf)
-        Print.success("Alternate PDF saved successfully")
+        ReportHtml.save(report, content)
 
     @staticmethod
-    def download_pdf(cls, download_link, content):
-        print("Downloading PDF...")
+    def download_pdf(cls, downloader, download_link, content, report):
+        print("Queueing PDF download...")
         # Check valid url
         if validators.url(download_link):
-            response = requests.get(download_link)
-            if response.status_code == 200:
-                with open("./bcpt_pdf/dsc/metadata.pdf", "wb") as f:
-                    f.write(response.content)
-                Print.success(f"Download PDF: {download_link} successfully")
-            else:
-                Print.error("PDF Expired")
-                logging.error(f"DSC - PDF Expired: {download_link}")
-                cls.save_alternate_pdf(content) if content else print("No content")
+            downloader.submit(
+                download_link,
+                report,
+                on_failure=lambda: (
+                    cls.save_alternate_html(content, report) if content else print("No content")
+                ),
+            )
         else:
             Print.error("Invalid URL")
             logging.error(f"DSC - Invalid URL: {download_link}")
-            cls.save_alternate_pdf(content) if content else print("No content")
+            cls.save_alternate_html(content, report) if content else print("No content")
 
-    @staticmethod
-    def insert_data(cursor, data, conn):
-        """Insert data into the SQLite database with retries."""
-        try:
-
-            insert_query = """
-                INSERT INTO reports (source, ticker, date, reportType, recommendation, headline, content, analyst, language, linkWeb, linkDrive)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            date_str = pd.Timestamp(data["date"]).strftime("%Y-%m-%d %H:%M:%S")
-            cursor.execute(
-                insert_query,
-                (
-                    data["source"],
-                    data["ticker"],
-                    date_str,
-                    data["reportType"],
-                    data["recommendation"],
-                    data["headline"],
-                    data["content"],
-                    data["analyst"],
-                    data["language"],
-                    data["linkWeb"],
-                    data["linkDrive"],
-                ),
-            )
+    @classmethod
+    def build_id(cls, stale=None):
+        """Next.js build ID of the site, cached on disk.
+
+        Pass the ID whose data urls answered 404 as stale to rediscover it,
+        workers hitting the same 404 then trigger a single discovery.
+        """
+        with cls._build_id_lock:
+            if cls._build_id is None:
+                cls._build_id = cls.read_build_id()
+            if cls._build_id is None or cls._build_id == stale:
+                cls._build_id = cls.discover_build_id()
+                with open(cls.BUILD_ID_CACHE, "w") as f:
+                    f.write(cls._build_id)
+            return cls._build_id
 
-            conn.commit()
-            Print.success(f"Data inserted successfully")
+    @classmethod
+    def read_build_id(cls):
+        if not os.path.exists(cls.BUILD_ID_CACHE):
+            return None
+        with open(cls.BUILD_ID_CACHE) as f:
+            return f.read().strip() or None
 
-        except Exception as e:
-            Print.error(f"Error inserting {data['headline']}: {e}")
-            logging.error(f"VDS-AP - Error inserting {data['headline']}: {e}")
+    @classmethod
+    def discover_build_id(cls):
+        """Read the build ID from the _buildManifest.js preload of a category page."""
+        res_html = HttpClient.get(cls.LINKS_VI[0]).text
+        match = cls.BUILD_MANIFEST.search(res_html)
+        if match is None:
+            raise ValueError("No _buildManifest.js found on the category page")
+        Print.success(f"Found DSC build ID {match.group(1)}")
+        return match.group(1)
+
+    @staticmethod
+    def get_data_json(cls, slug, page=None):
+        """Next.js data of a category page, rediscovering the build ID on a 404."""
+        build_id = cls.build_id()
+        for attempt in range(2):
+            api_url = f"{cls.BASE_URL}/_next/data/{build_id}/bao-cao-phan-tich/{slug}.json?slug={slug}"
+            if page is not None:
+                api_url = api_url.replace(".json", f"/{page}.json") + f"&slug={page}"
+            res = HttpClient.get(api_url)
+            if res.status_code != 404 or attempt == 1:
+                res.raise_for_status()
+                return res.json()
+
+            """The site was redeployed, the build ID changed"""
+            build_id = cls.build_id(stale=build_id)
 
     @classmethod
-    def crawl_bcpt_dsc(cls, cursor, conn):
+    def crawl_bcpt_dsc(cls, cursor, conn, incremental=False):
         """Main method to crawl reports and insert data into the database."""
+        writer = ReportWriter(conn)
+        known = KnownReports(conn)
+        downloader = PdfDownloader()
         for lang in cls.LANGUAGE_LIST:
             if lang == "VI":
                 print("Crawling VI reports...")
                 for idx, link in enumerate(cls.LINKS_VI):
                     report_type = cls.REPORT_TYPES[idx]
                     print(f"Crawling {report_type} reports...")
+                    state = CrawlState(conn, "dsc", report_type, lang, incremental)
 
-                    """Get preload url"""
+                    """Get the page count from the Next.js data of the category"""
                     try:
-                        res_html = requests.get(link, headers=cls.header).text
-                        soup = BeautifulSoup(res_html, "html.parser")
-                        preload_url = (
-                            soup.find(
-                                "link",
-                                {
-                                    "rel": "preload",
-                                    "as": "script",
-                                    "href": lambda x: x
-                                    and x.endswith("/_buildManifest.js"),
-                                },
-                            )
-                            .get("href")
-                            .replace("static", "data")
-                        )
-                        preload_url = "/".join(preload_url.split("/")[:-1])
                         slug = link.split("/")[-1]
-                        api_url = f"{cls.BASE_URL}{preload_url}/bao-cao-phan-tich/{slug}.json?slug={slug}"
-
-                        res = requests.get(api_url, headers=cls.header)
-                        res_json = res.json()
+                        res_json = cls.get_data_json(cls, slug)
                         page_num = res_json["pageProps"]["dataCategory"]["dataList"]["meta"]["pagination"]["pageCount"]
 
-                        for page in range(page_num):
-                            url = (
-                                api_url.replace(".json", f"/{page + 1}.json")
-                                + f"&slug={page + 1}"
-                            )
-                            res = requests.get(url, headers=cls.header)
-                            res_json = res.json()
+                        """Fetch the pages concurrently, in order"""
+                        window = CrawlEngine.INCREMENTAL_WINDOW if incremental else None
+                        pages = CrawlEngine.iter_map(
+                            lambda page, slug=slug: cls.get_data_json(cls, slug, page + 1),
+                            range(page_num),
+                            window,
+                            url_of=lambda page: cls.BASE_URL,
+                        )
+                        for page, res_json in pages:
                             # page = res_json["pageProps"]["dataCategory"]["dataList"]["meta"]["pagination"]["page"]
+                            if res_json is None:
+                                state.incomplete()
+                                continue
                             Print.success(f"Crawling page {page + 1} of {page_num}...")
 
                             data = res_json["pageProps"]["dataCategory"]["dataList"][
                                 "data"
                             ]
+
+                            """Stop once the page only holds already crawled reports"""
+                            keys = [
+                                (item["attributes"]["public_at"], item["attributes"]["slug"])
+                                for item in data
+                            ]
+                            for date, item_slug in keys:
+                                state.seen(date, item_slug)
+                            if state.page_is_known(keys):
+                                print("Reached already crawled reports, stop paging.")
+                                break
+
                             for data_raw in data:
                                 data_raw = data_raw["attributes"]
+                                if state.is_known(data_raw["public_at"], data_raw["slug"]):
+                                    continue
+                                if data_raw["slug"] and known.contains(
+                                    "dsc", lang, f"{cls.BASE_URL}/bao-cao-phan-tich/{data_raw['slug']}"
+                                ):
+                                    continue
                                 ticker = None
                                 recommendation = None
 
@@ -257,23 +241,31 @@ class BcptDscService:
                                 }
 
                                 '''Insert and download pdf'''
-                                # cls.download_pdf(cls, download_link, content_html)
-                                # cls.insert_data(cursor, metadata, conn)
+                                cls.download_pdf(cls, downloader, download_link, content_html, ReportWriter.identity(metadata))
+                                writer.add(metadata)
+                            writer.flush()
+
+                        state.commit()
                     except Exception as e:
-                        print(f"Error getting preload url: {e}")
-                        logging.error(f"DSC - Error getting preload url: {e}")
+                        print(f"Error getting category data: {e}")
+                        logging.error(f"DSC - Error getting category data: {e}")
 
                     """Download and insert data"""
                     # cls.get_data(cls, lang, page_id, report_type, cursor, conn)
             else:
                 print("EN Reports unavailable!")
 
+        downloader.join()
+        writer.close()
+
 
-# Connect to the SQLite
-conn = sqlite3.connect("reports.db")
-cursor = conn.cursor()
+# Run the crawl only when executed as a script
+if __name__ == "__main__":
+    # Connect to the SQLite
+    conn = sqlite3.connect("reports.db")
+    cursor = conn.cursor()
 
-bcpt_service = BcptDscService()
-bcpt_service.crawl_bcpt_dsc(cursor, conn)
+    bcpt_service = BcptDscService()
+    bcpt_service.crawl_bcpt_dsc(cursor, conn, incremental="--incremental" in sys.argv)
 
-conn.close()
+    conn.close()
@@ -1,25 +1,25 @@
+import itertools
+import logging
 import sqlite3
+import sys
 import validators
-import requests
-import time
 import pandas as pd
-import random
-import pdfkit
 
-from selenium import webdriver
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
-from requests.exceptions import SSLError
 from bs4 import BeautifulSoup
 from print_module import Print
-
-config = pdfkit.configuration(
-    wkhtmltopdf=r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
-)
+from browser_pool import BrowserPool
+from http_client import HttpClient
+from crawl_engine import CrawlEngine
+from crawl_state import CrawlState
+from report_writer import ReportWriter
+from known_reports import KnownReports
+from pdf_downloader import PdfDownloader
+from pdf_renderer import PdfRenderer
 
 
 class BcptVcbsService:
@@ -65,108 +65,42 @@ class BcptVcbsService:
 
     BASE_URL = "https://vcbs.com.vn"
 
+    # Listings crawled in parallel, every category in both locales
+    CATEGORY_WORKERS = 12
+
     @staticmethod
-    def save_alternate_pdf(content, headline):
+    def save_alternate_pdf(content, report):
         """Convert PDF file"""
         print("Saving alternate PDF...")
         for img_tag in content.find_all("img"):
             img_tag.decompose()
 
-        content_str = str(content)
-        html_str = (
-            """<html>
-                    <head>
-                    <title>Title of the document</title>
-                    <style>
-                        html * {
-                        font-family: Arial, Helvetica, sans-serif;
-                        }
-                    </style>
-                    </head>
-                    <body>"""
-            + content_str.replace("font-size: 14pt;", "font-size: 12pt;")
-            + """</body>
-                </html>"""
-        )
-
-        r = pdfkit.PDFKit(
-            html_str,
-            options={
-                "encoding": "UTF-8",
-                "enable-local-file-access": None,
-                "margin-left": "40mm",
-                "margin-right": "40mm",
-                "quiet": "",
-            },
-            configuration=config,
-            type_="string",
-        )
-        pdf = r.to_pdf()
-        with open("./bcpt_pdf/vcbs/metadata.pdf", "wb") as f:
-            # with open(f"./bcpt_pdf/vcbs/{headline}.pdf", "wb") as f:
-            f.write(pdf)
-        Print.success("PDF downloaded successfully!")
+        PdfRenderer.render(report, content)
 
     @staticmethod
-    def download_pdf(cls, download_link, content, headline):
+    def download_pdf(cls, downloader, download_link, content, report):
         # Check valid url
         if validators.url(download_link):
-            response = requests.get(download_link)
-            if response.status_code == 200:
-                with open(f"./bcpt_pdf/vcbs/{headline}.pdf", "wb") as f:
-                # with open(f"./bcpt_pdf/vcbs/metadata.pdf", "wb") as f:
-                    f.write(response.content)
-                Print.success("PDF downloaded successfully!")
-            else:
-                Print.warning("PDF Expired!")
-                (
-                    cls.save_alternate_pdf(content, headline)
+            downloader.submit(
+                download_link,
+                report,
+                on_failure=lambda: (
+                    cls.save_alternate_pdf(content, report)
                     if content
                     else print("No content")
-                )
+                ),
+            )
         else:
             Print.warning("Invalid URL!")
             (
-                cls.save_alternate_pdf(content, headline)
+                cls.save_alternate_pdf(content, report)
                 if content
                 else print("No content")
             )
 
     @staticmethod
-    def insert_data(cursor, data, conn, retries=3):
-        """Insert data into the SQLite database with retries."""
-        date_str = pd.Timestamp(data["date"]).strftime("%Y-%m-%d %H:%M:%S")
-        insert_query = f"""
-            INSERT INTO reports (source, ticker, date, reportType, recommendation, headline, content, analyst, language, linkWeb, linkDrive)
-            VALUES ('{data["source"]}', '{data["ticker"]}', '{date_str}', '{data["reportType"]}', '{data["recommendation"]}', '{data["headline"]}', '{data["content"]}', '{data["analyst"]}', '{data["language"]}', '{data["linkWeb"]}', '{data["linkDrive"]}')
-        """
-        while retries > 0:
-            try:
-                cursor.execute(insert_query)
-                conn.commit()
-                Print.success("Data inserted SQLite3 successfully!")
-                break
-            except Exception as e:
-                Print.error(f"Error inserting {data['headline']}: {e}")
-                retries -= 1
-                time.sleep(random.randint(1, 3))
-
-    @classmethod
-    def crawl_bcpt_vcbs(cls, cursor, conn):
-        """Main method to crawl reports and insert data into the database."""
-
-        options = webdriver.ChromeOptions()
-        options.add_experimental_option("excludeSwitches", ["enable-logging"])
-        options.add_argument("--log-level=3")  # Suppress logs
-        options.add_argument("--disable-logging")  # Disable logging
-        options.add_argument("--silent")  # Silent mode
-        options.add_argument("headless")
-        options.add_argument("window-size=1920x1080")
-        options.add_argument("disable-gpu")
-        service = Service(executable_path=ChromeDriverManager().install())
-        driver = webdriver.Chrome(options=options, service=service)
-        driver = webdriver.Chrome(options=options)
-        driver.set_page_load_timeout(30)
+    def login(driver):
+        """Log a new pool driver in, raises TimeoutException when it fails."""
         print("Logging in VCBS...")
         driver.get(
             "https://trading.vcbs.com.vn/SSOServer/Account/Login?returnUrl=https%3a%2f%2ftrading.vcbs.com.vn%2fSSOServer%2fOAuth%2fAuth%3fresponse_type%3dcode%26client_id%3dvcbswebsite%26scope%3dOnline-Read%2bOnline-Write%26redirect_uri%3dhttps%3a%252F%252Fvcbs.com.vn%252Flogin-sso"
@@ -184,145 +118,204 @@ class BcptVcbsService:
         login_button.click()
 
         # Wait for the div.o-notify_wrapper to be present
+        WebDriverWait(driver, 30).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "div.o-notify_wrapper"))
+        )
+        Print.success("Login VCBS successfully!")
+
+        driver.get("https://vcbs.com.vn/trung-tam-phan-tich")
+
+    @classmethod
+    def open_session(cls):
+        """Log in once in a browser and hand its cookies to the HttpClient sessions."""
+        driver = BrowserPool.create_driver()
         try:
-            WebDriverWait(driver, 30).until(
-                EC.presence_of_element_located(
-                    (By.CSS_SELECTOR, "div.o-notify_wrapper")
+            cls.login(driver)
+            HttpClient.load_cookies(driver.get_cookies())
+        finally:
+            driver.quit()
+
+    @staticmethod
+    def date_of(data_raw):
+        return (
+            pd.to_datetime(data_raw["createdAt"])
+            .tz_localize(None)
+            .strftime("%Y-%m-%d %H:%M:%S")
+        )
+
+    @staticmethod
+    def resolve_link(download_url):
+        """linkWeb of a report, the file its logged in link redirects to, else None."""
+        with HttpClient.get(download_url, stream=True) as response:
+            if response.status_code != 200:
+                return None
+            if response.url != download_url:
+                return response.url
+            content_type = response.headers.get("Content-Type", "")
+            return response.url if "application/pdf" in content_type else None
+
+    @classmethod
+    def crawl_category(cls, lang, idx, state, writer, known, downloader, incremental):
+        """Crawl one (language, report type) listing, paged through the JSON API only."""
+        report_type = cls.REPORT_TYPES[idx]
+        link = cls.LINKS_VI[idx] if lang == "VI" else cls.LINKS_EN[idx]
+
+        """The first page also tells how many pages there are"""
+        first_url = f"{link}&page=1"
+        first_json = HttpClient.get_json(first_url)
+        page_num = first_json["meta"]["totalPages"]
+        print(f"Crawling {lang} {report_type} reports")
+
+        """Fetch the remaining listing pages concurrently"""
+        window = CrawlEngine.INCREMENTAL_WINDOW if incremental else None
+        page_jsons = itertools.chain(
+            [(first_url, first_json)],
+            CrawlEngine.iter_json(
+                [f"{link}&page={page + 1}" for page in range(1, page_num)], window
+            ),
+        )
+
+        """Iterate through each page"""
+        for page, (page_url, page_json) in enumerate(page_jsons):
+            print("--------------------")
+            print(f"Crawling {lang} {report_type} page {page + 1} of {page_num}...")
+
+            if page_json is None:
+                """Give a failed page one more try before leaving the mark alone"""
+                try:
+                    page_json = HttpClient.get_json(page_url)
+                except Exception as e:
+                    Print.error(f"Skipping page {page + 1} of {page_num}: {e}")
+                    logging.error(f"VCBS - Skipping {page_url}: {e}")
+                    state.incomplete()
+                    continue
+            data_raw_list = page_json["data"]
+
+            """Stop once the page only holds already crawled reports"""
+            keys = [(data_raw["createdAt"], data_raw["id"]) for data_raw in data_raw_list]
+            for date, report_id in keys:
+                state.seen(date, report_id)
+            if state.page_is_known(keys):
+                print("Reached already crawled reports, stop paging.")
+                break
+            data_raw_list = [
+                data_raw
+                for data_raw in data_raw_list
+                if not state.is_known(data_raw["createdAt"], data_raw["id"])
+                and not known.contains(
+                    "vcbs", lang, ReportWriter.headline_key(cls.date_of(data_raw), data_raw["name"])
+                )
+            ]
+
+            """Resolve the report links over HTTP concurrently"""
+            download_urls = [
+                f"https://vcbs.com.vn/bao-cao-phan-tich/{data_raw['id']}?login=true"
+                for data_raw in data_raw_list
+            ]
+            link_webs = CrawlEngine.map(cls.resolve_link, download_urls)
+
+            """Get data of each report"""
+            for data_raw, linkWeb in zip(data_raw_list, link_webs):
+                print(f'Crawling {data_raw["name"]}...')
+                if linkWeb is None:
+                    Print.warning(f"No file behind {data_raw['name']}")
+
+                ticker = (
+                    data_raw["stockSymbol"]
+                    if report_type == "Company Research"
+                    else None
+                )
+                date = cls.date_of(data_raw)
+                # recommendation = data_raw["name"].lower() if report_type == "Company Research" else None
+                headline = data_raw["name"]
+                content_html = BeautifulSoup(
+                    data_raw["description"], "html.parser"
+                )
+                content = content_html.get_text()
+
+                data = {
+                    "source": "vcbs",
+                    "ticker": ticker,
+                    "date": date,
+                    "reportType": report_type,
+                    "recommendation": None,
+                    "headline": headline,
+                    "content": content,
+                    "analyst": None,
+                    "language": lang,
+                    "linkWeb": linkWeb,
+                    "linkDrive": None,
+                }
+
+                """Insert and queue PDF download"""
+                writer.add(data)
+                cls.download_pdf(
+                    cls, downloader, linkWeb, content_html, ReportWriter.identity(data)
                 )
-            )
-            Print.success("Login VCBS successfully!")
-
-            driver.get("https://vcbs.com.vn/trung-tam-phan-tich")
-
-            for lang in cls.LANGUAGE_LIST:
-                for idx, report_type in enumerate(cls.REPORT_TYPES):
-                    link = cls.LINKS_VI[idx] if lang == "VI" else cls.LINKS_EN[idx]
-                    link_page = cls.LINK_VI_PAGE if lang == "VI" else cls.LINK_EN_PAGE
-                    report_code = cls.REPORT_CODES[idx]
-
-                    try:
-                        res_json = requests.get(link).json()
-                        page_num = res_json["meta"]["totalPages"]
-                        print(f"Crawling {lang} {report_type} reports")
-
-                        """Navigate to each report page"""
-                        page_url = f"{link_page}?code={report_code}"
-                        driver.get(page_url)
-                        time.sleep(random.randint(3, 5))
-
-                        """Iterate through each page"""
-                        for page in range(page_num):
-                            print("--------------------")
-                            print(f"Crawling page {page + 1} of {page_num}...")
-
-                            """Navigating to the next page"""
-                            try:
-                                next_page_button = WebDriverWait(driver, 30).until(
-                                    EC.element_to_be_clickable(
-                                        (By.XPATH, f"//a[text()='{page + 1}']")
-                                    )
-                                )
-                                next_page_button.click()
-                                time.sleep(random.randint(2, 4))
-                                print(f"Navigate to the page {page + 1}...")
-
-                                reports_link = f"{link}&page={page + 1}"
-                                data_raw_list = requests.get(reports_link).json()["data"]
-                                time.sleep(1)
-
-                                """Open new tab for each report"""
-                                print("Opening new tab...")
-                                driver.execute_script("window.open('');")
-                                driver.switch_to.window(driver.window_handles[1])
-
-                                """Get data of each report"""
-                                for idx, data_raw in enumerate(data_raw_list):
-                                    print(f'Crawling {data_raw["name"]}...')
-
-                                    """Get linkWeb"""
-                                    download_url = f"https://vcbs.com.vn/bao-cao-phan-tich/{data_raw['id']}?login=true"
-                                    try:
-                                        driver.get(download_url)
-                                        WebDriverWait(driver, 30).until(
-                                            EC.url_changes(driver.current_url)
-                                        )
-                                        linkWeb = driver.current_url
-                                        time.sleep(random.randint(2, 4))
-
-                                        ticker = (
-                                            data_raw["stockSymbol"]
-                                            if report_type == "Company Research"
-                                            else None
-                                        )
-                                        date = (
-                                            pd.to_datetime(data_raw["createdAt"])
-                                            .tz_localize(None)
-                                            .strftime("%Y-%m-%d %H:%M:%S")
-                                        )
-                                        # recommendation = data_raw["name"].lower() if report_type == "Company Research" else None
-                                        headline = data_raw["name"]
-                                        content_html = BeautifulSoup(
-                                            data_raw["description"], "html.parser"
-                                        )
-                                        content = content_html.get_text()
-
-                                        data = {
-                                            "source": "vcbs",
-                                            "ticker": ticker,
-                                            "date": date,
-                                            "reportType": report_type,
-                                            "recommendation": None,
-                                            "headline": headline,
-                                            "content": content,
-                                            "analyst": None,
-                                            "language": lang,
-                                            "linkWeb": linkWeb,
-                                            "linkDrive": None,
-                                        }
-
-                                        """Insert and download PDF"""
-                                        cls.insert_data(cursor, data, conn)
-                                        cls.download_pdf(
-                                            cls, linkWeb, content_html, headline
-                                        )
-
-                                    except SSLError as ssl_err:
-                                        Print.error(f"SSLError encountered: {ssl_err}")
-                                        time.sleep(random.randint(2, 4))
-                                        continue  # Skip this report and move to the next one
-
-                                    except TimeoutException:
-                                        Print.error(
-                                            f"Timeout exception for {data_raw['name']}"
-                                        )
-                                        time.sleep(random.randint(2, 4))
-                                        continue
-
-                                """Close the tab"""
-                                print("Closing tab...")
-                                driver.close()
-                                driver.switch_to.window(driver.window_handles[0])
-
-                            except TimeoutException:
-                                print(
-                                    f"Timeout exception for page {page + 1} of {page_num}")
-                                continue
-
-                    except Exception as e:
-                        print(f"Error: {e}")
 
+            writer.flush()
+
+    @classmethod
+    def crawl_bcpt_vcbs(cls, cursor, conn, incremental=False, workers=None):
+        """Main method to crawl reports and insert data into the database.
+
+        The browser is only used to log in, its cookies go to the HttpClient
+        sessions that resolve report links and download the files. Every
+        (language, report type) listing runs in its own worker, so pages of
+        all of them are fetched at once. conn must be opened with
+        check_same_thread=False. Each worker calls seen(), is_known() and
+        incomplete() on the CrawlState of its listing, so the states are used
+        concurrently. They are committed from this thread under the writer's
+        lock once their worker is done.
+        """
+        try:
+            cls.open_session()
         except TimeoutException:
             Print.error("Login failed")
-
-        driver.quit()
+            return
+
+        writer = ReportWriter(conn)
+        known = KnownReports(conn)
+        downloader = PdfDownloader()
+
+        """Load every crawl state before the workers start writing"""
+        listings = [
+            (lang, idx, CrawlState(conn, "vcbs", report_type, lang, incremental))
+            for lang in cls.LANGUAGE_LIST
+            for idx, report_type in enumerate(cls.REPORT_TYPES)
+        ]
+        states = {}
+        with ThreadPoolExecutor(
+            max_workers=workers or cls.CATEGORY_WORKERS, thread_name_prefix="vcbs"
+        ) as executor:
+            for lang, idx, state in listings:
+                future = executor.submit(
+                    cls.crawl_category, lang, idx, state, writer, known, downloader, incremental
+                )
+                states[future] = state
+
+            for future in as_completed(states):
+                try:
+                    future.result()
+                    """The workers commit on the same connection, never interleave with them"""
+                    with writer.lock:
+                        states[future].commit()
+                except Exception as e:
+                    print(f"Error: {e}")
+
+        downloader.join()
+        PdfRenderer.join()
+        writer.close()
         Print.success("Done VCBS!")
 
 
-# Connect to the SQLite
-conn = sqlite3.connect("reports.db")
-cursor = conn.cursor()
+# Run the crawl only when executed as a script
+if __name__ == "__main__":
+    # Connect to the SQLite
+    conn = sqlite3.connect("reports.db", check_same_thread=False)
+    cursor = conn.cursor()
 
-bcpt_service = BcptVcbsService()
-bcpt_service.crawl_bcpt_vcbs(cursor, conn)
+    bcpt_service = BcptVcbsService()
+    bcpt_service.crawl_bcpt_vcbs(cursor, conn, incremental="--incremental" in sys.argv)
 
-conn.close()
+    conn.close()
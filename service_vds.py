@@ -1,19 +1,20 @@
-import time
-import requests
+import sys
 import re
 import sqlite3
-import validators
-import io
-import pdfplumber
-import random
-import pandas as pd
 
 from dateutil import parser
-import pdfkit
+from http_client import HttpClient
+from crawl_engine import CrawlEngine
+from crawl_state import CrawlState
+from report_writer import ReportWriter
+from known_reports import KnownReports
+from text_extractor import TextExtractor
 
-config = pdfkit.configuration(
-    wkhtmltopdf=r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
-)
+# Optional, lets listing pages be parsed while they download
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 class BcptVdsService:
 
@@ -34,78 +35,43 @@ class BcptVdsService:
 
     API_URL = "https://vdsc.com.vn/data/api/app/management-report/public-paged"
 
+    # Fixed page size, large responses from this API tend to time out
+    PAGE_SIZE = 200
+    INCREMENTAL_PAGE_SIZE = 50
+
     @staticmethod
-    def insert_data(cursor, data, conn, retries=3):
-        """Insert data into the SQLite database with retries."""
-        date_str = pd.Timestamp(data["date"]).strftime("%Y-%m-%d %H:%M:%S")
-        insert_query = f"""
-            INSERT INTO reports (source, ticker, date, reportType, recommendation, headline, content, analyst, language, linkWeb, linkDrive)
-            VALUES ('{data["source"]}', '{data["ticker"]}', '{date_str}', '{data["reportType"]}', '{data["recommendation"]}', '{data["headline"]}', '{data["content"]}', '{data["analyst"]}', '{data["language"]}', '{data["linkWeb"]}', '{data["linkDrive"]}')
-        """
-        while retries > 0:
-            try:
-                cursor.execute(insert_query)
-                conn.commit()
-                print("Data inserted successfully!")
-                break
-            except Exception as e:
-                print(f"Error inserting {data['headline']}: {e}")
-                retries -= 1
-                time.sleep(random.randint(1, 3))
+    def link_web_of(lang, item):
+        file_id = item["file"] if lang == "VI" else item["fileEn"]
+        return (
+            f"https://www.vdsc.com.vn/data/api/app/file-storage/{file_id}"
+            if file_id
+            else None
+        )
 
     @staticmethod
-    def download_pdf(download_link, get_text=False, download=True):
-        # Check valid url
-        if validators.url(download_link):
-            response = requests.get(download_link)
-            if response.status_code == 200:
-                if download:
-                    with open("./bcpt_pdf/vds/metadata.pdf", "wb") as f:
-                        f.write(response.content)
-                file_downloaded = io.BytesIO(response.content)
-                try:
-                    with pdfplumber.open(file_downloaded) as pdf:
-                        text = pdf.pages[0].extract_text()
-                        if get_text:
-                            return " ".join(text.split("\n")[:10])
-                except Exception as e:
-                    print(f"Error processing PDF: {e}")
-                    return None
-            else:
-                print("PDF Expired")
-                return None
-        else:
-            print("Invalid URL")
-            return None
+    def report_key_of(cls, lang, item):
+        """The key ReportWriter gives the item's record, without building the record"""
+        headline = item["title"] if lang == "VI" else item["titleEn"]
+        return cls.link_web_of(lang, item) or ReportWriter.headline_key(
+            parser.parse(item["publishDate"]).strftime("%Y-%m-%d %H:%M:%S"), headline or None
+        )
 
     @staticmethod
     def transform_data(cls, lang, item, report_type):
         """Transform raw data to the desired format."""
         if lang == "VI":
             headline = item["title"] if item["title"] else None
-            link_web = (
-                f"https://www.vdsc.com.vn/data/api/app/file-storage/{item['file']}"
-                if item["file"]
-                else None
-            )
         else:
             headline = item["titleEn"] if item["titleEn"] else None
-            link_web = (
-                f"https://www.vdsc.com.vn/data/api/app/file-storage/{item['fileEn']}"
-                if item["fileEn"]
-                else None
-            )
+        link_web = cls.link_web_of(lang, item)
         date = parser.parse(item["publishDate"]).strftime("%Y-%m-%d %H:%M:%S")
 
         """Get ticker and recommendation"""
         if report_type == "Company Research":
             match = re.findall(r"\b[A-Z0-9]{3}\b", headline)
             ticker = match[0] if match else None
-            recomendation = (
-                cls.download_pdf(link_web, get_text=True, download=False)
-                if link_web
-                else None
-            )
+            # Read from the first PDF page by the TextExtractor
+            recomendation = None
         else:
             ticker = None
             recomendation = None
@@ -127,69 +93,203 @@ class BcptVdsService:
         return data
 
     @staticmethod
-    def get_data(cls, lang, group_id, report_type, cursor, conn):
+    def has_language(lang, item):
+        """True when an item has a version in lang."""
+        if lang == "VI":
+            return bool(item["title"] or item["file"])
+        return bool(item["titleEn"] or item["fileEn"])
+
+    @staticmethod
+    def total_count(cls, group_id, lang):
+        api_url = f"{cls.API_URL}?groupId={group_id}&language={lang.lower()}&maxResultCount=1"
+        return HttpClient.get(api_url).json()["totalCount"]
+
+    @staticmethod
+    def fetch_items(url):
+        """Items of one listing page, parsed while they stream in when ijson is installed."""
+        if ijson is None:
+            return HttpClient.get_json(url)["items"]
+        with HttpClient.get(url, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return list(ijson.items(response.raw, "items.item", use_float=True))
+
+    @staticmethod
+    def iter_pages(cls, api_url, total_record, page_size, window=None):
+        """Yield the items of every page in order, None for a page that failed."""
+        page_urls = [
+            f"{api_url}&sorting=publishDate%20desc&skipCount={skip_count}&maxResultCount={page_size}"
+            for skip_count in range(0, total_record, page_size)
+        ]
+        for _, items in CrawlEngine.iter_map(cls.fetch_items, page_urls, window):
+            yield items
+
+    @staticmethod
+    def crawl_states(conn, report_type, languages, incremental, group_id):
+        return {
+            language: CrawlState(conn, "vds", report_type, language, incremental, category=group_id)
+            for language in languages
+        }
+
+    @staticmethod
+    def get_data(
+        cls,
+        lang,
+        group_id,
+        report_type,
+        writer,
+        known,
+        extractor,
+        conn,
+        incremental=False,
+        languages=None,
+        skip_ids=frozenset(),
+        states=None,
+    ):
+        """Crawl the lang listing of a group, emitting every version in languages an item has.
+
+        Returns the ids of the listed items that have a version, per language.
+        Crawl states passed in by the caller are left for the caller to commit.
+        """
+        languages = languages or [lang]
+        covered = {language: set() for language in languages}
+
         """Get total records"""
         api_url = f"{cls.API_URL}?groupId={group_id}&language={lang.lower()}"
-        res = requests.get(api_url).json()
+        res = HttpClient.get(api_url).json()
         total_record = res["totalCount"]
 
         """Check number of records"""
         if total_record == 0:
             print(f"No data for {report_type} in {lang} language.")
-            return
-
-        if total_record > 1000:
-            skip_count = 0
-            while skip_count < total_record:
-                url = f"{api_url}&sorting=publishDate%20desc&skipCount={skip_count}&maxResultCount=1000"
-                res_json = requests.get(url).json()
-                items = res_json["items"]
-                skip_count += 1000
-                for item in items:
-                    """Tranform data"""
-                    data = cls.transform_data(cls, lang, item, report_type)
+            return covered
 
-                    """Download and insert data"""
-                    # cls.download_pdf(data["linkWeb"], download=True)
-                    # cls.insert_data(cursor, data, conn)
+        """Stream fixed-size pages, smaller ones when crawling incrementally"""
+        page_size = cls.INCREMENTAL_PAGE_SIZE if incremental else cls.PAGE_SIZE
+        owned = states is None
+        if owned:
+            states = cls.crawl_states(conn, report_type, languages, incremental, group_id)
+        state = states[lang]
+        window = CrawlEngine.INCREMENTAL_WINDOW if incremental else None
+        for items in cls.iter_pages(cls, api_url, total_record, page_size, window):
+            if items is None:
+                for language_state in states.values():
+                    language_state.incomplete()
+                continue
 
-        else:
-            time.sleep(1)
-            url = f"{api_url}&sorting=publishDate%20desc&maxResultCount={total_record}"
-            res_json = requests.get(url).json()
-            items = res_json["items"]
-            for item in items:
-                """Tranform data"""
-                data = cls.transform_data(cls, lang, item, report_type)
-
-                """Download and insert data"""
-                # cls.download_pdf(data["linkWeb"], download=True)
-                # cls.insert_data(cursor, data, conn)
+            """Every item of the listing is a version in lang, the others only when filled in"""
+            versions = [
+                (language, item)
+                for item in items
+                for language in languages
+                if language == lang or cls.has_language(language, item)
+            ]
+            for language, item in versions:
+                covered[language].add(item["id"])
+                states[language].seen(item["publishDate"], item["id"])
+
+            """Stop once the page only holds already crawled reports"""
+            keys = [(item["publishDate"], item["id"]) for item in items]
+            if state.page_is_known(keys):
+                print("Reached already crawled reports, stop paging.")
+                break
+            versions = [
+                (language, item)
+                for language, item in versions
+                if item["id"] not in skip_ids
+                and not states[language].is_known(item["publishDate"], item["id"])
+                and not known.contains("vds", language, cls.report_key_of(cls, language, item))
+            ]
+
+            """Tranform data"""
+            data_list = []
+            for language, item in versions:
+                try:
+                    data_list.append(cls.transform_data(cls, language, item, report_type))
+                except Exception as e:
+                    print(f"Error transforming {language} report {item['id']}: {e}")
+                    continue
+
+            """Insert data"""
+            for data in data_list:
+                writer.add(data)
+            writer.flush()
+
+            """Parse the first PDF page of Company Research in the process pool"""
+            if report_type == "Company Research":
+                for data in data_list:
+                    if data["linkWeb"]:
+                        extractor.submit(
+                            ReportWriter.identity(data), data["linkWeb"], recommendation=True
+                        )
+
+        if owned:
+            for language_state in states.values():
+                language_state.commit()
+        return covered
 
     @classmethod
-    def crawl_bcpt_vds(cls, cursor, conn):
-
-        for lang in cls.LANGUAGE:
-            (
-                print("Crawling VI reports...")
-                if lang == "VI"
-                else print("Crawling EN reports...")
-            )
+    def crawl_bcpt_vds(cls, cursor, conn, incremental=False, bilingual=True):
+        """Crawl every group, with bilingual both languages come from the VI listing."""
+        writer = ReportWriter(conn)
+        known = KnownReports(conn)
+        extractor = TextExtractor()
+
+        if bilingual:
+            print("Crawling VI and EN reports...")
             for idx, group_id in enumerate(cls.REPORT_GROUP_ID):
                 report_type = cls.REPORT_TYPE[idx]
-                print(f"Crawling {lang} {report_type} ...")
+                print(f"Crawling VI/EN {report_type} ...")
+                """Both passes judge EN items against the mark of the previous run"""
+                states = cls.crawl_states(conn, report_type, cls.LANGUAGE, incremental, group_id)
+                covered = cls.get_data(
+                    cls, "VI", group_id, report_type, writer, known, extractor, conn,
+                    incremental, languages=cls.LANGUAGE, states=states,
+                )
 
-                """Download and insert data"""
-                cls.get_data(cls, lang, group_id, report_type, cursor, conn)
+                """Walk the EN listing only for reports missing from the VI one"""
+                if incremental or cls.total_count(cls, group_id, "EN") > len(covered["EN"]):
+                    print(f"Crawling EN-only {report_type} ...")
+                    cls.get_data(
+                        cls, "EN", group_id, report_type, writer, known, extractor, conn,
+                        incremental, skip_ids=covered["EN"], states={"EN": states["EN"]},
+                    )
+
+                for language_state in states.values():
+                    language_state.commit()
+        else:
+            for lang in cls.LANGUAGE:
+                (
+                    print("Crawling VI reports...")
+                    if lang == "VI"
+                    else print("Crawling EN reports...")
+                )
+                for idx, group_id in enumerate(cls.REPORT_GROUP_ID):
+                    report_type = cls.REPORT_TYPE[idx]
+                    print(f"Crawling {lang} {report_type} ...")
+
+                    """Download and insert data"""
+                    cls.get_data(
+                        cls, lang, group_id, report_type, writer, known, extractor, conn, incremental
+                    )
 
+        writer.close()
+        extractor.join()
         print("Done VDS")
 
 
-# Connect to the SQLite
-conn = sqlite3.connect("reports.db")
-cursor = conn.cursor()
+# Run the crawl only when executed as a script
+if __name__ == "__main__":
+    # Connect to the SQLite
+    conn = sqlite3.connect("reports.db")
+    cursor = conn.cursor()
 
-bcpt_service = BcptVdsService()
-bcpt_service.crawl_bcpt_vds(cursor, conn)
+    bcpt_service = BcptVdsService()
+    bcpt_service.crawl_bcpt_vds(
+        cursor,
+        conn,
+        incremental="--incremental" in sys.argv,
+        bilingual="--per-language" not in sys.argv,
+    )
 
-conn.close()
+    conn.close()
@@ -1,24 +1,19 @@
-import time
-import requests
 import sqlite3
-import random
+import sys
 import pandas as pd
-import pdfkit
-import base64
-import io
 import logging
-import os
-import re
 
 from slugify import slugify
-from PIL import Image
 from print_module import Print
+from http_client import HttpClient
+from crawl_engine import CrawlEngine
+from crawl_state import CrawlState
+from report_writer import ReportWriter
+from known_reports import KnownReports
+from link_validator import LinkValidator
+from report_html import ReportHtml
+from html_images import HtmlImages
 from bs4 import BeautifulSoup
-# from weasyprint import HTML
-
-config = pdfkit.configuration(
-    wkhtmltopdf=r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
-)
 
 # os.add_dll_directory(r"C:\msys64\mingw64\bin")
 
@@ -39,253 +34,261 @@ class BcptVdsAPService:
     API_URL = "https://vdsc.com.vn/data/api/app/management-market-commentary/public-paged?sorting=publishDate%20desc"
 
     @staticmethod
-    def insert_data(cursor, data, conn):
-        """Insert data into the SQLite database with retries."""
-        try:
-
-            insert_query = """
-                INSERT INTO reports (source, ticker, date, reportType, recommendation, headline, content, analyst, language, linkWeb, linkDrive)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            date_str = pd.Timestamp(data["date"]).strftime("%Y-%m-%d %H:%M:%S")
-            cursor.execute(insert_query, (
-                data["source"], 
-                data["ticker"], 
-                date_str, 
-                data["reportType"], 
-                data["recommendation"], 
-                data["headline"], 
-                data["content"], 
-                data["analyst"], 
-                data["language"], 
-                data["linkWeb"], 
-                data["linkDrive"]
-            ))
-
-            # insert_query = f"""
-            #     INSERT INTO reports (source, ticker, date, reportType, recommendation, headline, content, analyst, language, linkWeb, linkDrive)
-            #     VALUES ('{data["source"]}', '{data["ticker"]}', '{date_str}', '{data["reportType"]}', '{data["recommendation"]}', '{data["headline"]}', '{data["content"]}', '{data["analyst"]}', '{data["language"]}', '{data["linkWeb"]}', '{data["linkDrive"]}')
-            # """
-            # cursor.execute(insert_query)
-            conn.commit()
-            Print.success(f"Data inserted successfully")
+    def download_pdf(cls, content, report):
+        """Store the sanitized HTML, its PDF is rendered on demand"""
+        base_url_vdsc = "https://vdsc.com.vn"
+        ReportHtml.save(report, HtmlImages.sanitize(content, base_url_vdsc))
 
-        except Exception as e:
-            Print.error(f"Error inserting {data['headline']}: {e}")
-            logging.error(f"VDS-AP - Error inserting {data['headline']}: {e}")
+    @staticmethod
+    def link_web_of(lang, item):
+        """Public article url of an item"""
+        if lang == "VI":
+            return (
+                f"https://vdsc.com.vn/trung-tam-phan-tich/nhan-dinh-hang-ngay/{item['slug']}-d{item['id']}"
+                if item["slug"]
+                else f"https://vdsc.com.vn/trung-tam-phan-tich/nhan-dinh-hang-ngay/{slugify(item['title'])}-d{item['id']}"
+            )
+        return (
+            f"https://vdsc.com.vn/en/research/daily-recommendations/{item['slugEn']}-d{item['id']}"
+            if item["slugEn"]
+            else f"https://vdsc.com.vn/en/research/daily-recommendations/{slugify(item['titleEn'])}-d{item['id']}"
+        )
 
     @staticmethod
-    def download_and_convert_image(url):
-        """Fetches a WebP image, converts it to PNG, and returns Base64 encoding."""
-        response = requests.get(url)
-        response.raise_for_status() 
-        webp_image_bytes = response.content
-  
-        with Image.open(io.BytesIO(webp_image_bytes)) as img:
-            with io.BytesIO() as output:
-                img.save(output, format="PNG")
-                png_image_bytes = output.getvalue()
-
-        base64_image = base64.b64encode(png_image_bytes).decode('utf-8')
-        
-        return base64_image
+    def headline_key_of(lang, item):
+        """Key of a post stored without its link, after the link failed the check"""
+        headline = item["title"] if lang == "VI" else item["titleEn"]
+        date = pd.to_datetime(item["publishDate"]).tz_localize(None)
+        return ReportWriter.headline_key(date, headline or None)
 
     @staticmethod
-    def download_pdf(cls, content):
-        """Convert HTML to PDF"""
-        base_url_vdsc = "https://vdsc.com.vn"
+    def process_item(cls, lang, item, report_type, links):
+        """Transform and store one item with its checked link, None if it must be skipped."""
+        """Get ticker"""
+        tickers = (
+            ",".join([elem["name"] for elem in item["stockSymbol"]])
+            if item["stockSymbol"]
+            else None
+        )
 
-        for img_tag in content.find_all("img"):
-            src = img_tag.get("src")
-            '''Check valid src'''
-            if re.match(r'^(http|https|/|\.\/|data:image)', src) is None:
-                img_tag.decompose()
-                continue
+        """Transform raw data to the desired format"""
+        if lang == "VI":
+            headline = item["title"] if item["title"] else None
+            raw_content = item["content"]
+            analyst = item["author"] if item["author"] else None
+        else:
+            headline = item["titleEn"] if item["titleEn"] else None
+            raw_content = item["contentEn"]
+            analyst = item["authorEn"] if item["authorEn"] else None
+
+        link_web = cls.link_web_of(lang, item)
+
+        '''Check link_web'''
+        link_valid = links.get(link_web)
+        if link_valid is None:
+            Print.error(f"Error checking link {link_web}")
+            logging.error(f"Error checking link {link_web}")
+            return None
+        if not link_valid:
+            Print.error(f"Link {link_web} is not valid")
+            logging.error(f"Link {link_web} is not valid")
+            link_web = None
+
+        '''Get content'''
+        content_html = (
+            BeautifulSoup(raw_content, "html.parser")
+            if raw_content
+            else None
+        )
+        content = content_html.get_text() if content_html else None
 
-            if src.startswith("./assets"):
-                img_tag["src"] = f"{base_url_vdsc}{src[1:]}"
-                # Print.warning(f"Add base_url before ./asset URL")
-            elif src.startswith("/data/api/app/file-storage/") or 'data:image' not in src:
-                if not src.startswith('data:image'):
-                    img_tag["src"] = f"{base_url_vdsc}{src}" if src.startswith("/data/api") else src
-                    # Print.warning(f"Add base_url before ./data/api/app URL")
-                    try:
-                        base64_image = cls.download_and_convert_image(img_tag["src"])
-                        img_tag["src"] = f"data:image/png;base64,{base64_image}"
-                        # Print.success(f"Image converted to base64")
-                    except Exception as e:
-                        print(img_tag["src"])
-                        Print.error(f"Error converting webp to png: {e}")
-                        logging.error(f"VDS-AP - Error converting image to base64: {e}")
-
-        content_str = str(content)
-        html_str = f"""
-        <html>
-            <head>
-                <title></title>
-                <meta charset="UTF-8">
-                <style>
-                    img {{
-                        max-width: 100%;
-                        height: auto;
-                    }}
-                    html * {{
-                        font-family: Arial, Helvetica, sans-serif;
-                    }}
-                </style>
-            </head>
-            <body>
-                {content_str.replace("font-size: 14pt;", "font-size: 12pt;")}
-            </body>
-        </html>
-        """
-        # print(html_str)
-
-        r = pdfkit.PDFKit(
-            html_str,
-            options={
-                "encoding": "UTF-8",
-                "enable-local-file-access": None,
-                "margin-left": "40mm",
-                "margin-right": "40mm",
-                "quiet": "",
-            },
-            configuration=config,
-            type_="string",
+        date = (
+            pd.to_datetime(item["publishDate"])
+            .tz_localize(None)
+            .strftime("%Y-%m-%d %H:%M:%S")
         )
 
-        pdf = r.to_pdf()
-        with open(f"./bcpt_pdf/vds_ap/metadata.pdf", "wb") as f:
-            f.write(pdf)
+        data = {
+            "source": "vds",
+            "ticker": tickers,
+            "date": date,
+            "reportType": report_type,
+            "recommendation": None,
+            "headline": headline,
+            "content": content,
+            "analyst": analyst,
+            "language": lang,
+            "linkWeb": link_web,
+            "linkDrive": None,
+        }
+        print(f"Crawling {data['linkWeb']} ...")
+
+        """Download"""
+        try:
+            cls.download_pdf(cls, content_html, ReportWriter.identity(data))
+        except Exception as e:
+            Print.error(f"Error crawling {data['linkWeb']}: {e}")
+            logging.error(f"VDS-AP - Error crawling {data['linkWeb']}: {e}")
+            return None
+        return data
 
-        # HTML(string=html_str).write_pdf(f"./bcpt_pdf/vds_ap/test_output.pdf")
-        Print.success(f"PDF saved!")
+    @staticmethod
+    def has_language(lang, item):
+        """True when a post has a version in lang, one that has a title or slug to link to."""
+        if lang == "VI":
+            return bool(item["title"] or item["slug"])
+        return bool(item["titleEn"] or item["slugEn"])
 
     @classmethod
-    def crawl_bcpt_vds_ap(cls, cursor, conn):
-
-        for lang in cls.LANGUAGE:
-            print("Crawling VI reports...") if lang == "VI" else print("Crawling EN reports...")
-
-            report_type = cls.REPORT_TYPE[0]
-            print(f"Crawling {lang} {report_type} ...")
-
-            """Get total records"""
-            api_url = f"{cls.API_URL}&language={lang.lower()}"
-            res = requests.get(api_url).json()
-            total_record = res["totalCount"]
-
-            # skip_count = 1434
-            skip_count = 0
-            while skip_count < total_record:
-                url = f"{api_url}&skipCount={skip_count}&maxResultCount=20"
-                res_json = requests.get(url).json()
-                items = res_json["items"]
-                skip_count += 20
-                for item in items:
-                    """Get ticker"""
-                    tickers = (
-                        ",".join([elem["name"] for elem in item["stockSymbol"]])
-                        if item["stockSymbol"]
-                        else None
-                    )
-
-                    """Transform raw data to the desired format"""
-                    if lang == "VI":
-                        headline = item["title"] if item["title"] else None
-                        link_web = (
-                            f"https://vdsc.com.vn/trung-tam-phan-tich/nhan-dinh-hang-ngay/{item['slug']}-d{item['id']}"
-                            if item["slug"]
-                            else f"https://vdsc.com.vn/trung-tam-phan-tich/nhan-dinh-hang-ngay/{slugify(headline)}-d{item['id']}"
-                        )
-                        '''Check link_web'''
-                        try:
-                            response = requests.get(link_web)
-                            if response.status_code != 200:
-                                link_web = None
-                                Print.error(f"Link {link_web} is not valid")
-                                logging.error(f"Link {link_web} is not valid")
-                        except Exception as e:
-                            link_web = None
-                            Print.error(f"Error checking link {link_web}: {e}")
-                            logging.error(f"Error checking link {link_web}: {e}")
-                            continue
-
-                        '''Get content'''
-                        content_html = (
-                            BeautifulSoup(item["content"], "html.parser")
-                            if item["content"]
-                            else None
-                        )
-                        content = content_html.get_text() if content_html else None
-                        analyst = item["author"] if item["author"] else None
-                    else:
-                        headline = item["titleEn"] if item["titleEn"] else None
-                        link_web = (
-                            f"https://vdsc.com.vn/en/research/daily-recommendations/{item['slugEn']}-d{item['id']}"
-                            if item["slugEn"]
-                            else f"https://vdsc.com.vn/en/research/daily-recommendations/{slugify(headline)}-d{item['id']}"
-                        )
-                        '''Check link_web'''
-                        try:
-                            response = requests.get(link_web)
-                            if response.status_code != 200:
-                                link_web = None
-                                Print.error(f"Link {link_web} is not valid")
-                                logging.error(f"Link {link_web} is not valid")
-                        except Exception as e:
-                            link_web = None
-                            Print.error(f"Error checking link {link_web}: {e}")
-                            logging.error(f"Error checking link {link_web}: {e}")
-                            continue
-
-                        '''Get content'''
-                        content_html = (
-                            BeautifulSoup(item["contentEn"], "html.parser")
-                            if item["contentEn"]
-                            else None
-                        )
-                        content = content_html.get_text() if content_html else None
-                        analyst = item["authorEn"] if item["authorEn"] else None
-
-                    date = (
-                        pd.to_datetime(item["publishDate"])
-                        .tz_localize(None)
-                        .strftime("%Y-%m-%d %H:%M:%S")
-                    )
-
-                    data = {
-                        "source": "vds",
-                        "ticker": tickers,
-                        "date": date,
-                        "reportType": report_type,
-                        "recommendation": None,
-                        "headline": headline,
-                        "content": content,
-                        "analyst": analyst,
-                        "language": lang,
-                        "linkWeb": link_web,
-                        "linkDrive": None,
-                    }
-                    print(f"Crawling {data['linkWeb']} ...")
-
-                    """Download and insert data"""
-                    time.sleep(random.randint(1, 2))
-                    try:
-                        cls.download_pdf(cls, content_html)
-                        cls.insert_data(cursor, data, conn)
-                    except Exception as e:
-                        Print.error(f"Error crawling {data['linkWeb']}: {e}")
-                        logging.error(f"VDS-AP - Error crawling {data['linkWeb']}: {e}")
+    def total_count(cls, lang):
+        api_url = f"{cls.API_URL}&language={lang.lower()}&maxResultCount=1"
+        return HttpClient.get(api_url).json()["totalCount"]
+
+    @staticmethod
+    def crawl_states(conn, report_type, languages, incremental):
+        return {
+            language: CrawlState(conn, "vds", report_type, language, incremental)
+            for language in languages
+        }
 
+    @staticmethod
+    def get_data(
+        cls,
+        lang,
+        report_type,
+        writer,
+        known,
+        conn,
+        incremental=False,
+        languages=None,
+        skip_ids=frozenset(),
+        states=None,
+    ):
+        """Crawl the lang listing, emitting every version in languages a post has.
+
+        Returns the ids of the listed posts that have a version, per language.
+        Crawl states passed in by the caller are left for the caller to commit.
+        """
+        languages = languages or [lang]
+        covered = {language: set() for language in languages}
+
+        """Get total records"""
+        api_url = f"{cls.API_URL}&language={lang.lower()}"
+        res = HttpClient.get(api_url).json()
+        total_record = res["totalCount"]
+
+        """Fetch pages of 20 records concurrently"""
+        page_urls = [
+            f"{api_url}&skipCount={skip_count}&maxResultCount=20"
+            for skip_count in range(0, total_record, 20)
+        ]
+        owned = states is None
+        if owned:
+            states = cls.crawl_states(conn, report_type, languages, incremental)
+        state = states[lang]
+        window = CrawlEngine.INCREMENTAL_WINDOW if incremental else None
+        for _, res_json in CrawlEngine.iter_json(page_urls, window):
+            if res_json is None:
+                for language_state in states.values():
+                    language_state.incomplete()
+                continue
+            items = res_json["items"]
+
+            """Every post of the listing is a version in lang, the others only when filled in"""
+            versions = [
+                (language, item)
+                for item in items
+                for language in languages
+                if language == lang or cls.has_language(language, item)
+            ]
+            for language, item in versions:
+                covered[language].add(item["id"])
+                states[language].seen(item["publishDate"], item["id"])
+
+            """Stop once the page only holds already crawled posts"""
+            keys = [(item["publishDate"], item["id"]) for item in items]
+            if state.page_is_known(keys):
+                print("Reached already crawled posts, stop paging.")
+                break
+            versions = [
+                (language, item)
+                for language, item in versions
+                if item["id"] not in skip_ids
+                and not states[language].is_known(item["publishDate"], item["id"])
+                and not known.contains(
+                    "vds", language, cls.link_web_of(language, item), cls.headline_key_of(language, item)
+                )
+            ]
+
+            """Check the links of the whole page concurrently, then process items"""
+            links = LinkValidator.check_all(
+                cls.link_web_of(language, item) for language, item in versions
+            )
+            data_list = CrawlEngine.map(
+                lambda version: cls.process_item(cls, *version, report_type, links),
+                versions,
+                url_of=lambda version: cls.API_URL,
+            )
+
+            """Insert data"""
+            for data in data_list:
+                if data is not None:
+                    writer.add(data)
+            writer.flush()
+
+        if owned:
+            for language_state in states.values():
+                language_state.commit()
+        return covered
+
+    @classmethod
+    def crawl_bcpt_vds_ap(cls, cursor, conn, incremental=False, bilingual=True):
+        """Crawl the pinboard, with bilingual both languages come from the VI listing."""
+        writer = ReportWriter(conn)
+        known = KnownReports(conn)
+        report_type = cls.REPORT_TYPE[0]
+
+        if bilingual:
+            print(f"Crawling VI/EN {report_type} ...")
+            """Both passes judge EN posts against the mark of the previous run"""
+            states = cls.crawl_states(conn, report_type, cls.LANGUAGE, incremental)
+            covered = cls.get_data(
+                cls, "VI", report_type, writer, known, conn, incremental,
+                languages=cls.LANGUAGE, states=states,
+            )
+
+            """Walk the EN listing only for posts missing from the VI one"""
+            if incremental or cls.total_count("EN") > len(covered["EN"]):
+                print(f"Crawling EN-only {report_type} ...")
+                cls.get_data(
+                    cls, "EN", report_type, writer, known, conn, incremental,
+                    skip_ids=covered["EN"], states={"EN": states["EN"]},
+                )
+
+            for language_state in states.values():
+                language_state.commit()
+        else:
+            for lang in cls.LANGUAGE:
+                print("Crawling VI reports...") if lang == "VI" else print("Crawling EN reports...")
+                print(f"Crawling {lang} {report_type} ...")
+                cls.get_data(cls, lang, report_type, writer, known, conn, incremental)
+
+        writer.close()
         print("Done VDS")
 
 
-# Connect to the SQLite
-conn = sqlite3.connect("reports.db")
-cursor = conn.cursor()
+# Run the crawl only when executed as a script
+if __name__ == "__main__":
+    # Connect to the SQLite
+    conn = sqlite3.connect("reports.db")
+    cursor = conn.cursor()
 
-bcpt_service = BcptVdsAPService()
-bcpt_service.crawl_bcpt_vds_ap(cursor, conn)
+    bcpt_service = BcptVdsAPService()
+    bcpt_service.crawl_bcpt_vds_ap(
+        cursor,
+        conn,
+        incremental="--incremental" in sys.argv,
+        bilingual="--per-language" not in sys.argv,
+    )
 
-conn.close()
+    conn.close()
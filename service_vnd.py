@@ -1,22 +1,25 @@
-import requests
-import time
-import pandas as pd
-import random
-import os
+import logging
 import re
-import pdfkit
 import sqlite3
+import sys
 import validators
 
-config = pdfkit.configuration(
-    wkhtmltopdf=r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
-)
-
-from selenium import webdriver
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
 from bs4 import BeautifulSoup
+from print_module import Print
+from browser_pool import BrowserPool
+from http_client import HttpClient
+from crawl_engine import CrawlEngine
+from rate_limiter import RateLimiter
+from crawl_state import CrawlState
+from report_writer import ReportWriter
+from known_reports import KnownReports
+from pdf_downloader import PdfDownloader
+from report_html import ReportHtml
+from vnd_parser import VndParser
 
 
 class BcptVndService:
@@ -40,211 +43,263 @@ class BcptVndService:
         "https://www.vndirect.com.vn/category/bao-cao-trai-phieu/",  # Bond Report
     ]
 
+    # Categories crawled in parallel, browser fallbacks share one BrowserPool
+    CATEGORY_WORKERS = 7
+    BROWSERS = 2
+
+    _pool = None
+
     @staticmethod
-    def save_alternate_pdf(driver):
-        """Convert PDF file"""
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        content = soup.find("section")
+    def save_alternate_html(page_source, report):
+        """Store the article without images, its PDF is rendered on demand"""
+        soup = BeautifulSoup(page_source, "html.parser")
+        content = soup.find("section") or soup.body
+        if content is None:
+            Print.error(f"No article content to store for {report[2]}")
+            logging.error(f"VND - No article content to store for {report[2]}")
+            return
         for img_tag in content.find_all("img"):
             img_tag.decompose()
 
-        content_str = str(content)
-        html_str = (
-            """<html>
-                    <head>
-                    <title>Title of the document</title>
-                    <style>
-                        html * {
-                        font-family: Arial, Helvetica, sans-serif;
-                        }
-                    </style>
-                    </head>
-                    <body>"""
-            + content_str.replace("font-size: 14pt;", "font-size: 12pt;")
-            + """</body>
-                </html>"""
-        )
-
-        r = pdfkit.PDFKit(
-            html_str,
-            options={
-                "encoding": "UTF-8",
-                "enable-local-file-access": None,
-                "margin-left": "40mm",
-                "margin-right": "40mm",
-                "quiet": "",
-            },
-            configuration=config,
-            type_="string",
-        )
-
-        print("Saving PDF...")
-        pdf = r.to_pdf()
-        with open("./bcpt_pdf/vnd/metadata.pdf", "wb") as f:
-            f.write(pdf)
-        print("PDF saved!")
+        ReportHtml.save(report, content)
 
     @staticmethod
-    def download_pdf(cls, single_content, driver):
-        print("Downloading PDF...")
-        download_element = single_content.find_elements(By.CSS_SELECTOR, "a")
-        if download_element:
-            download_url = download_element[-1].get_attribute("href")
+    def download_pdf(cls, downloader, download_url, page_source, report):
+        print("Queueing PDF download...")
+        # The page is gone before the download runs, keep its HTML for the fallback
+        if download_url:
             # Check valid url
             if validators.url(download_url):
-                response = requests.get(download_url)
-                if response.status_code == 200:
-                    with open("./bcpt_pdf/vnd/metadata.pdf", "wb") as f:
-                        f.write(response.content)
-                else:
-                    print("PDF Expired")
-                    cls.save_alternate_pdf(driver)
+                downloader.submit(
+                    download_url,
+                    report,
+                    on_failure=lambda: cls.save_alternate_html(page_source, report),
+                )
             else:
                 print("Invalid URL")
-                cls.save_alternate_pdf(driver)
+                cls.save_alternate_html(page_source, report)
         else:
             print("No URL provided")
-            cls.save_alternate_pdf(driver)
+            cls.save_alternate_html(page_source, report)
 
     @staticmethod
-    def insert_data(cursor, data, conn, retries=3):
-        """Insert data into the SQLite database with retries."""
-        date_str = pd.Timestamp(data["date"]).strftime("%Y-%m-%d %H:%M:%S")
-        insert_query = f"""
-          INSERT INTO reports (source, ticker, date, reportType, recommendation, headline, content, analyst, language, linkWeb, linkDrive)
-          VALUES ('{data["source"]}', '{data["ticker"]}', '{date_str}', '{data["reportType"]}', '{data["recommendation"]}', '{data["headline"]}', '{data["content"]}', '{data["analyst"]}', '{data["language"]}', '{data["linkWeb"]}', '{data["linkDrive"]}')
-      """
-        while retries > 0:
+    def listing_from_http(url):
+        """(article links, page count) of a listing page, None when it cannot be parsed."""
+        response = HttpClient.get(url)
+        if response.status_code != 200:
+            return None
+        links, page_num = VndParser.parse_listing(response.text, url)
+        return (links, page_num) if links else None
+
+    @staticmethod
+    def listing_from_browser(driver, url):
+        RateLimiter.acquire(url)
+        driver.get(url)
+        return VndParser.parse_listing(driver.page_source, url)
+
+    @classmethod
+    def listing_of(cls, url):
+        try:
+            listing = cls.listing_from_http(url)
+        except Exception as e:
+            Print.warning(f"Fast path failed for {url}: {e}")
+            listing = None
+        if listing is None:
+            Print.warning(f"Falling back to the browser for {url}")
+            with cls._pool.session() as driver:
+                listing = cls.listing_from_browser(driver, url)
+        return listing
+
+    @staticmethod
+    def article_from_http(link_page):
+        """Fields of an article read over plain HTTP, None when the page cannot be parsed."""
+        response = HttpClient.get(link_page)
+        if response.status_code != 200:
+            return None
+        return VndParser.parse_article(response.text, link_page)
+
+    @staticmethod
+    def article_from_browser(driver, link_page):
+        """Fields of an article rendered in a browser tab.
+
+        The DOM is read back once as a page_source snapshot and parsed in
+        process, instead of one WebDriver round trip per element and cell.
+        """
+        """Move to 2nd tab"""
+        RateLimiter.acquire(link_page)
+        driver.execute_script("window.open(arguments[0], '_blank');", link_page)
+        driver.switch_to.window(driver.window_handles[-1])
+        try:
+            WebDriverWait(driver, 30).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, VndParser.CONTENT))
+            )
+            page_source = driver.page_source
+        finally:
+            driver.close()
+            driver.switch_to.window(driver.window_handles[0])
+
+        article = VndParser.parse_article(page_source, link_page)
+        if article is None:
+            raise ValueError(f"Incomplete article page {link_page}")
+        return article
+
+    @classmethod
+    def crawl_category(cls, idx, link, state, writer, known, downloader, incremental):
+        """Crawl every listing page of one report type."""
+        report_type = cls.REPORT_TYPES[idx]
+
+        """Get page numbers"""
+        try:
+            _, page_num = cls.listing_of(link)
+        except Exception as e:
+            Print.error(f"Error getting page count of {report_type}: {e}")
+            logging.error(f"VND - Error getting page count of {link}: {e}")
+            state.incomplete()
+            return
+
+        # for page in range(58,59):
+        for page in range(page_num):
+            """Move to page"""
+            print(f"Crawling {report_type} page {page + 1} of {page_num}...")
+            page_url = f"{link}page/{page}/"
             try:
-                cursor.execute(insert_query)
-                conn.commit()
-                print("Data inserted successfully!")
-                break
+                contents, _ = cls.listing_of(page_url)
             except Exception as e:
-                print(f"Error inserting {data['headline']}: {e}")
-                retries -= 1
-                time.sleep(2)
+                Print.error(f"Error crawling page {page + 1} of {page_num}: {e}")
+                logging.error(f"VND - Error crawling {page_url}: {e}")
+                state.incomplete()
+                continue
+
+            """Fetch the new articles over HTTP concurrently, the browser only for failures"""
+            links = [
+                link_page
+                for link_page in contents
+                if not known.contains("vnd", "VI", link_page)
+            ]
+            articles = CrawlEngine.map(cls.article_from_http, links)
+
+            has_new = False
+            for link_page, article in zip(links, articles):
+                if article is None:
+                    Print.warning(f"Falling back to the browser for {link_page}")
+                    try:
+                        with cls._pool.session() as driver:
+                            article = cls.article_from_browser(driver, link_page)
+                    except Exception as e:
+                        Print.error(f"Error crawling {link_page}: {e}")
+                        logging.error(f"VND - Error crawling {link_page}: {e}")
+                        state.incomplete()
+                        continue
+                date = article["date"]
+
+                # Skip articles stored by a previous run
+                state.seen(date, link_page)
+                if state.is_known(date, link_page):
+                    continue
+                has_new = True
+
+                headline = article["headline"]
+
+                # Get ticker and recommendation
+                print(f"Crawling {report_type}...")
+                if report_type == "Company Research":
+                    match = re.search(r"^[A-Z0-9]{1,5}", headline)
+                    ticker = match.group(0) if match else headline.split(" ")[0]
+                    print(f"Ticker: {ticker}")
+                    recommendation = article["recommendation"]
+                    if recommendation is None:
+                        print("No recommendation found")
+                else:
+                    ticker = None
+                    recommendation = None
+
+                # Create metadata
+                data = {
+                    "source": "vnd",
+                    "ticker": ticker,
+                    "date": date,
+                    "reportType": report_type,
+                    "recommendation": recommendation,
+                    "headline": headline,
+                    "content": article["content"],
+                    "analyst": None,
+                    "language": "VI",
+                    "linkWeb": link_page,
+                    "linkDrive": None,
+                }
+
+                # Download PDF file
+                cls.download_pdf(
+                    cls,
+                    downloader,
+                    article["download_url"],
+                    article["page_source"],
+                    ReportWriter.identity(data),
+                )
+
+                # Insert data into SQLite
+                writer.add(data)
+
+            writer.flush()
+            if incremental and contents and not has_new:
+                print("Reached already crawled reports, stop paging.")
+                break
 
     @classmethod
-    def crawl_bcpt_vnd(cls, cursor, conn):
-        """Setup Chrome driver"""
-        options = webdriver.ChromeOptions()
-        options.add_experimental_option("excludeSwitches", ["enable-logging"])
-        options.add_argument("--log-level=3")  # Suppress logs
-        options.add_argument("--disable-logging")  # Disable logging
-        options.add_argument("--silent")  # Silent mode
-        options.add_argument("headless")
-        options.add_argument("window-size=1920x1080")
-        options.add_argument("disable-gpu")
-        service = Service(executable_path=ChromeDriverManager().install())
-        driver = webdriver.Chrome(options=options, service=service)
-        driver.set_page_load_timeout(30)
+    def crawl_bcpt_vnd(cls, cursor, conn, incremental=False, workers=None, browsers=None):
+        """Crawl the report types in parallel.
+
+        conn must be opened with check_same_thread=False, the workers share
+        the ReportWriter. Each worker calls seen(), is_known() and
+        incomplete() on the CrawlState of its category, so the states are
+        used concurrently. They are committed from this thread under the
+        writer's lock once their worker is done.
+        """
+        writer = ReportWriter(conn)
+        known = KnownReports(conn)
+        downloader = PdfDownloader()
+        cls._pool = BrowserPool(size=browsers or cls.BROWSERS)
 
         """Iterate through each report type"""
-        for idx, link in enumerate(cls.LINKS_VI):
-            driver.get(link)
-            time.sleep(2)
-
-            """Get page numbers"""
-            page_numbers = driver.find_elements(By.CSS_SELECTOR, ".page-numbers")
-            page_numbers = [p.text for p in page_numbers]
-            page_num = max([int(p) for p in page_numbers if p.isdigit()], default=1)
-
-            # for page in range(58,59):
-            for page in range(page_num):
-                """Move to page"""
-                print(f"Crawling page {page + 1} of {page_num}...")
-                page_url = f"{link}page/{page}/"
-                driver.get(page_url)
-                contents = driver.find_elements(
-                    By.CSS_SELECTOR, ".news-item .news-infor [href]"
+        """Load every crawl state before the workers start writing"""
+        category_states = [
+            CrawlState(conn, "vnd", report_type, "VI", incremental)
+            for report_type in cls.REPORT_TYPES
+        ]
+        states = {}
+        with ThreadPoolExecutor(
+            max_workers=workers or cls.CATEGORY_WORKERS, thread_name_prefix="vnd"
+        ) as executor:
+            for idx, link in enumerate(cls.LINKS_VI):
+                state = category_states[idx]
+                future = executor.submit(
+                    cls.crawl_category, idx, link, state, writer, known, downloader, incremental
                 )
+                states[future] = state
+
+            for future in as_completed(states):
+                try:
+                    future.result()
+                    """The workers commit on the same connection, never interleave with them"""
+                    with writer.lock:
+                        states[future].commit()
+                except Exception as e:
+                    Print.error(f"Error crawling {states[future].key[1]}: {e}")
+                    logging.error(f"VND - Error crawling {states[future].key[1]}: {e}")
 
-                for c in contents:
-                    """Move to 2nd tab"""
-                    link_page = c.get_attribute("href")
-                    driver.execute_script(
-                        "window.open(arguments[0], '_blank');", link_page
-                    )
-                    driver.switch_to.window(driver.window_handles[-1])
-                    time.sleep(random.randint(1, 2))
-
-                    single_content = driver.find_element(
-                        By.CSS_SELECTOR, ".single-content.content-text"
-                    )
-                    content = single_content.text.strip().replace("\n", " ")
-                    date_raw = driver.find_element(By.CSS_SELECTOR, ".fontita.font16")
-                    date_time = pd.to_datetime(
-                        date_raw.text.split(" ")[0], format="%d/%m/%Y"
-                    )
-                    date = date_time.strftime("%Y-%m-%d %H:%M:%S")
-                    headline = driver.find_element(
-                        By.CSS_SELECTOR, ".section-title.font700.font35"
-                    ).text.strip()
-                    report_type = cls.REPORT_TYPES[idx]
-
-                    # Get ticker and recommendation
-                    print(f"Crawling {report_type}...")
-                    if report_type == "Company Research":
-                        match = re.search(r"^[A-Z0-9]{1,5}", headline)
-                        ticker = match.group(0) if match else headline.split(" ")[0]
-                        print(f"Ticker: {ticker}")
-                        try:
-                            table = single_content.find_element(
-                                By.CSS_SELECTOR, "table"
-                            )
-                            rows = table.find_elements(By.CSS_SELECTOR, "tr")
-                            headers = rows[0].find_elements(By.CSS_SELECTOR, "td")
-                            data = rows[1].find_elements(By.CSS_SELECTOR, "td")
-                            khuyen_nghi_col_index = next(
-                                (
-                                    i
-                                    for i, h in enumerate(headers)
-                                    if "Khuyến nghị" in h.text
-                                ),
-                                None,
-                            )
-                            recommendation = data[khuyen_nghi_col_index].text
-                        except:
-                            recommendation = None
-                            print("No recommendation found")
-                    else:
-                        ticker = None
-                        recommendation = None
-
-                    # Create metadata
-                    data = {
-                        "source": "vnd",
-                        "ticker": ticker,
-                        "date": date,
-                        "reportType": report_type,
-                        "recommendation": recommendation,
-                        "headline": headline,
-                        "content": content,
-                        "analyst": None,
-                        "language": "VI",
-                        "linkWeb": link_page,
-                        "linkDrive": None,
-                    }
-
-                    # Download PDF file
-                    cls.download_pdf(cls, single_content, driver)
-
-                    # Insert data into SQLite
-                    cls.insert_data(cursor, data, conn)
-
-                    driver.close()
-                    driver.switch_to.window(driver.window_handles[0])
-
-        driver.quit()
+        downloader.join()
+        writer.close()
+        cls._pool.close()
         print("Done VND!")
 
 
-# Connect to the SQLite
-conn = sqlite3.connect("reports.db", timeout=10)
-cursor = conn.cursor()
+# Run the crawl only when executed as a script
+if __name__ == "__main__":
+    # Connect to the SQLite
+    conn = sqlite3.connect("reports.db", timeout=10, check_same_thread=False)
+    cursor = conn.cursor()
 
-vnd_service = BcptVndService()
-vnd_service.crawl_bcpt_vnd(cursor, conn)
+    vnd_service = BcptVndService()
+    vnd_service.crawl_bcpt_vnd(cursor, conn, incremental="--incremental" in sys.argv)
 
-conn.close()
+    conn.close()
@@ -0,0 +1,58 @@
+import sqlite3
+
+from known_reports import KnownReports
+from report_writer import ReportWriter
+
+OLD_COLUMNS = ", ".join(f"{column} TEXT" for column in ReportWriter.COLUMNS)
+
+
+def old_database(rows):
+    """A reports table from before reportKey existed."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute(f"CREATE TABLE reports ({OLD_COLUMNS})")
+    conn.executemany(
+        f"INSERT INTO reports ({', '.join(ReportWriter.COLUMNS)}) VALUES ({', '.join('?' for _ in ReportWriter.COLUMNS)})",
+        [tuple(row.get(column) for column in ReportWriter.COLUMNS) for row in rows],
+    )
+    conn.commit()
+    return conn
+
+
+def record(**values):
+    data = dict.fromkeys(ReportWriter.COLUMNS)
+    data.update(values)
+    return data
+
+
+def test_migration_keeps_reports_without_link_and_headline():
+    conn = old_database(
+        [
+            record(source="vds", language="VI", date="2024-01-01 00:00:00", content="a"),
+            record(source="vds", language="VI", date="2024-01-02 00:00:00", content="b"),
+        ]
+    )
+    ReportWriter(conn)
+
+    keys = [row[0] for row in conn.execute("SELECT reportKey FROM reports ORDER BY date")]
+    assert keys == ["2024-01-01 00:00:00|None", "2024-01-02 00:00:00|None"]
+
+
+def test_migrated_keys_match_the_writer():
+    rows = [
+        record(source="vds", language="VI", date="2024-01-01 00:00:00"),
+        record(source="vds", language="EN", date="2024-01-01 00:00:00", headline="H", linkWeb="https://x/1"),
+        record(source="vcbs", language="VI", date="2024-01-02 00:00:00", headline="V", linkWeb="https://x/2"),
+    ]
+    conn = old_database(rows)
+    ReportWriter(conn)
+
+    known = KnownReports(conn)
+    for data in rows:
+        assert known.contains(data["source"], data["language"], ReportWriter.report_key(data))
+
+    """Writing the same records again updates them in place"""
+    writer = ReportWriter(conn)
+    for data in rows:
+        writer.add(data)
+    writer.close()
+    assert conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0] == len(rows)
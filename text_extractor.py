@@ -0,0 +1,142 @@
+import io
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import pdfplumber
+
+from concurrent.futures import ProcessPoolExecutor, wait
+from http_client import HttpClient
+from http_range_file import HttpRangeFile
+from print_module import Print
+
+
+def extract_text(source, full_text=False):
+    """Parse a PDF given as bytes, a file path or a url, in a worker process.
+
+    Returns (first_page, full_text) with full_text None unless asked for,
+    or None when a url has no file behind it. Urls are read through Range
+    requests when only the first page is needed.
+    """
+    if isinstance(source, bytes):
+        file = io.BytesIO(source)
+    elif source.startswith(("http://", "https://")):
+        if full_text:
+            response = HttpClient.get(source)
+            file = io.BytesIO(response.content) if response.status_code == 200 else None
+        else:
+            file = HttpRangeFile.open(source)
+        if file is None:
+            return None
+    else:
+        file = source
+
+    with pdfplumber.open(file) as pdf:
+        first_page = pdf.pages[0].extract_text() if pdf.pages else None
+        text = (
+            "\n".join(page.extract_text() or "" for page in pdf.pages)
+            if full_text
+            else None
+        )
+    return first_page, text
+
+
+class TextExtractor:
+    """Process pool parsing PDFs off the crawler threads.
+
+    Results are written to the report_texts table as they come in, so
+    network fetching and CPU-bound parsing overlap. With recommendation=True
+    the first lines of the first page also become the report's
+    recommendation.
+    """
+
+    WORKERS = os.cpu_count()
+    DB_PATH = "reports.db"
+    RECOMMENDATION_LINES = 10
+
+    def __init__(self, workers=None, db_path=None):
+        """Spawned, a forked worker would inherit the crawler threads' SQLite connections"""
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers or self.WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self.futures = []
+
+        """Results are saved from the pool's callback thread"""
+        self.conn = sqlite3.connect(
+            db_path or self.DB_PATH, timeout=30, check_same_thread=False
+        )
+        self.lock = threading.Lock()
+        self.ensure_table(self.conn)
+
+    @staticmethod
+    def ensure_table(conn):
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS report_texts (
+                source TEXT NOT NULL,
+                language TEXT NOT NULL,
+                reportKey TEXT NOT NULL,
+                firstPage TEXT,
+                fullText TEXT,
+                extractedAt TEXT NOT NULL,
+                PRIMARY KEY (source, language, reportKey)
+            )
+            """
+        )
+        conn.commit()
+
+    @classmethod
+    def recommendation_of(cls, first_page):
+        return " ".join(first_page.split("\n")[: cls.RECOMMENDATION_LINES])
+
+    def submit(self, report, source, full_text=False, recommendation=False):
+        """Queue a PDF for report = (source, language, reportKey)."""
+        future = self.executor.submit(extract_text, source, full_text)
+        future.add_done_callback(
+            lambda future: self._save(report, future, recommendation)
+        )
+        self.futures.append(future)
+        return future
+
+    def _save(self, report, future, recommendation):
+        try:
+            result = future.result()
+        except Exception as e:
+            Print.error(f"Error processing PDF {report[2]}: {e}")
+            logging.error(f"EXTRACT - Error processing PDF {report[2]}: {e}")
+            return
+        if result is None:
+            print(f"PDF Expired: {report[2]}")
+            return
+
+        first_page, full_text = result
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO report_texts (source, language, reportKey, firstPage, fullText, extractedAt)
+                VALUES (?, ?, ?, ?, ?, datetime('now'))
+                ON CONFLICT (source, language, reportKey) DO UPDATE SET
+                    firstPage = excluded.firstPage,
+                    fullText = COALESCE(excluded.fullText, report_texts.fullText),
+                    extractedAt = excluded.extractedAt
+                """,
+                (*report, first_page, full_text),
+            )
+            if recommendation and first_page:
+                self.conn.execute(
+                    """
+                    UPDATE reports SET recommendation = ?
+                    WHERE source = ? AND language = ? AND reportKey = ?
+                    """,
+                    (self.recommendation_of(first_page), *report),
+                )
+            self.conn.commit()
+
+    def join(self):
+        """Wait for every queued PDF, their results are saved once this returns."""
+        wait(self.futures)
+        self.futures = []
+        self.executor.shutdown()
+        self.conn.close()
@@ -0,0 +1,75 @@
+import pandas as pd
+
+from urllib.parse import urljoin
+from lxml import html as lxml_html
+
+
+class VndParser:
+    """lxml parser for the server-rendered VNDirect WordPress pages."""
+
+    LISTING_LINKS = ".news-item .news-infor [href]"
+    PAGE_NUMBERS = ".page-numbers"
+    CONTENT = ".single-content.content-text"
+    DATE = ".fontita.font16"
+    HEADLINE = ".section-title.font700.font35"
+
+    @staticmethod
+    def text_of(element):
+        """Text of an element with whitespace collapsed, like the browser's .text."""
+        return " ".join(" ".join(element.itertext()).split())
+
+    @classmethod
+    def parse_listing(cls, page_html, url):
+        """(article links, page count) of a category page."""
+        doc = lxml_html.fromstring(page_html)
+        links = [urljoin(url, a.get("href")) for a in doc.cssselect(cls.LISTING_LINKS)]
+        page_numbers = [cls.text_of(p) for p in doc.cssselect(cls.PAGE_NUMBERS)]
+        page_num = max([int(p) for p in page_numbers if p.isdigit()], default=1)
+        return links, page_num
+
+    @classmethod
+    def parse_article(cls, page_html, url):
+        """Fields of an article page, None when the page is not a complete article."""
+        doc = lxml_html.fromstring(page_html)
+        single_content = doc.cssselect(cls.CONTENT)
+        date_raw = doc.cssselect(cls.DATE)
+        headline = doc.cssselect(cls.HEADLINE)
+        if not (single_content and date_raw and headline):
+            return None
+        single_content = single_content[0]
+
+        date_time = pd.to_datetime(
+            cls.text_of(date_raw[0]).split(" ")[0], format="%d/%m/%Y"
+        )
+        download_element = [a.get("href") for a in single_content.cssselect("a")]
+        return {
+            "headline": cls.text_of(headline[0]),
+            "date": date_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "content": cls.text_of(single_content),
+            "recommendation": cls.recommendation_of(single_content),
+            "download_url": (
+                urljoin(url, download_element[-1])
+                if download_element and download_element[-1]
+                else None
+            ),
+            "page_source": page_html,
+        }
+
+    @classmethod
+    def recommendation_of(cls, single_content):
+        """Value under the "Khuyến nghị" header of the first table, if any."""
+        tables = single_content.cssselect("table")
+        if not tables:
+            return None
+        rows = tables[0].cssselect("tr")
+        if len(rows) < 2:
+            return None
+        headers = rows[0].cssselect("td")
+        data = rows[1].cssselect("td")
+        khuyen_nghi_col_index = next(
+            (i for i, h in enumerate(headers) if "Khuyến nghị" in cls.text_of(h)),
+            None,
+        )
+        if khuyen_nghi_col_index is None or khuyen_nghi_col_index >= len(data):
+            return None
+        return cls.text_of(data[khuyen_nghi_col_index])